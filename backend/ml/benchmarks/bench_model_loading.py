@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: loading the ensemble from the compiled model bundle (predict.py compile-bundle)
+vs the loose model files, in fresh processes.
+
+    python benchmarks/bench_model_loading.py [--processes 1 4] [--repeat 3]
+
+For each loader, starts N processes at once; each imports predict, loads the scoring
+context (libraries are imported first, so load seconds are the model loading alone),
+scores one transaction and then stays alive while its memory is read from
+/proc/<pid>/smaps_rollup (Linux): RSS, PSS (shared pages split between the processes
+mapping them) and USS (private pages). The bundle is compiled into a temporary directory.
+Prints one JSON document with median load seconds and mean memory per process.
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import predict  # noqa: E402
+
+LOADERS = {"files": "false", "bundle": "true"}
+
+
+def child():
+    """Load and score once, report timings on stdout, then wait for stdin to close."""
+    imported = time.perf_counter()
+    for name in predict.STARTUP_PROFILE_MODULES:
+        importlib.import_module(name)
+    started = time.perf_counter()
+    ctx = predict.load_scoring_context()
+    loaded = time.perf_counter()
+    predict.score_transaction(dict(predict._PROFILE_TRANSACTION), ctx)
+    print(json.dumps({
+        "model_source": ctx["model_source"],
+        "library_seconds": started - imported,
+        "load_seconds": loaded - started,
+    }), flush=True)
+    sys.stdin.read()
+
+
+def run_processes(n, use_bundle, bundle_path):
+    env = dict(os.environ, USE_MODEL_BUNDLE=use_bundle, MODEL_BUNDLE_PATH=bundle_path,
+               SAVE_TO_DB="false", USE_DB_FEATURES="false", LOG_LEVEL="WARNING")
+    procs = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"], env=env,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(n)
+    ]
+    try:
+        reports = [json.loads(p.stdout.readline()) for p in procs]
+        memory = [predict.process_memory(p.pid) for p in procs]
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+    return reports, memory
+
+
+def mean_kb(memory, key):
+    values = [m[key] for m in memory if m is not None]
+    return round(statistics.mean(values)) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle_path = os.path.join(tmp, "ensemble_bundle")
+        predict.compile_model_bundle(bundle_path)
+        bundle_bytes = sum(os.path.getsize(os.path.join(bundle_path, name)) for name in os.listdir(bundle_path))
+        for n in args.processes:
+            for loader, use_bundle in LOADERS.items():
+                load_seconds, library_seconds, memory = [], [], []
+                for _ in range(args.repeat):
+                    reports, mem = run_processes(n, use_bundle, bundle_path)
+                    load_seconds += [r["load_seconds"] for r in reports]
+                    library_seconds += [r["library_seconds"] for r in reports]
+                    memory += mem
+                    assert all(r["model_source"].split(":")[0] == loader for r in reports), reports
+                results.append({
+                    "processes": n,
+                    "loader": loader,
+                    "load_seconds": round(statistics.median(load_seconds), 4),
+                    "library_seconds": round(statistics.median(library_seconds), 4),
+                    "rss_kb": mean_kb(memory, "rss_kb"),
+                    "pss_kb": mean_kb(memory, "pss_kb"),
+                    "uss_kb": mean_kb(memory, "uss_kb"),
+                })
+
+    print(json.dumps({"benchmark": "model_loading", "bundle_bytes": bundle_bytes, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
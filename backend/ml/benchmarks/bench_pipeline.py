@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: every stage of the scoring pipeline at several batch sizes, on stand-in models
+and synthetic transactions (benchmarks/synthetic.py), so it runs without models/.
+
+    python benchmarks/bench_pipeline.py [--rows 1 100 10000] [--repeat 5] [--models DIR | --real-models]
+                                        [--output results.json]
+
+Stages, timed on the same records:
+    engineer            normalize_input + compute_engineered_features per record
+    apply_bins          apply_bins over the engineered frame
+    encode              the compiled LabelEncoders over the string categoricals
+    prepare_features    prepare_features_for_model (binning, encoding, fill, column order)
+    ensemble_predict    ensemble_predict (1 row) / ensemble_predict_batch on the prepared frame
+    score_batch         score_batch end to end (no DB)
+and main() once per repeat: one transaction through the one-shot entry point, model loading
+included, as a fresh `python predict.py < tx.json` would run it minus the imports.
+
+The stand-in models are trained into a temporary directory first (a few seconds) unless
+--models names a directory written by `python benchmarks/synthetic.py DIR`; --real-models
+uses predict's own models/. Checks that score_batch agrees with score_transaction.
+Prints one JSON document (best time per stage and batch size) tagged with the git commit,
+so that runs on two commits can be compared.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import predict  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_main(record):
+    """predict.main() on one transaction; returns its parsed stdout."""
+    out = io.StringIO()
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(json.dumps(record))
+    try:
+        with contextlib.redirect_stdout(out):
+            predict.main()
+    finally:
+        sys.stdin = stdin
+    return json.loads(out.getvalue())
+
+
+def check_parity(records, ctx):
+    batch = predict.score_batch(records, ctx)
+    for record, b in zip(records, batch):
+        single = predict.score_transaction(dict(record), ctx)
+        assert single["prediction"] == b["prediction"], (single, b)
+        assert abs(single["confidence"] - b["confidence"]) <= 1e-9, (single, b)
+    main_out = run_main(records[0])
+    assert main_out["prediction"] == batch[0]["prediction"], (main_out, batch[0])
+
+
+def stages(records, ctx):
+    """name -> zero-argument callable for every timed stage, over the given records."""
+    df = synthetic.engineered_frame(records)
+    X = predict.prepare_features_for_model(df, ctx["encoder"], ctx["expected_order"])
+    encoders = ctx["encoder"]
+    columns = synthetic.encoder_input(df)
+    models = (ctx["cat_model"], ctx["xgb_model"], ctx["rf_model"], ctx["stacked_model"],
+              ctx["base_order"], ctx["decision_threshold"])
+    predict_fn = predict.ensemble_predict if len(records) == 1 else predict.ensemble_predict_batch
+    return {
+        "engineer": lambda: synthetic.engineered_frame(records),
+        "apply_bins": lambda: predict.apply_bins(df, predict.bins_config, predict.LOG_BIN_FEATURES),
+        "encode": lambda: [encoders[col].encode(values) for col, values in columns.items() if col in encoders],
+        "prepare_features": lambda: predict.prepare_features_for_model(df, encoders, ctx["expected_order"]),
+        "ensemble_predict": lambda: predict_fn(X, *models),
+        "score_batch": lambda: predict.score_batch(records, ctx),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--models", default=None, help="stand-in model directory (benchmarks/synthetic.py)")
+    source.add_argument("--real-models", action="store_true", help="use predict's models/ directory")
+    parser.add_argument("--train-rows", type=int, default=5000, help="training transactions for the stand-in models")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the JSON document to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.real_models:
+            model_dir = predict.MODELS_DIR
+            predict.SAVE_TO_DB = predict.USE_DB_FEATURES = False
+        else:
+            model_dir = args.models
+            if model_dir is None:
+                model_dir = os.path.join(tmp, "models")
+                synthetic.train_stand_in_models(model_dir, args.train_rows, args.seed)
+            synthetic.use_models(model_dir)
+
+        ctx = predict.load_scoring_context()
+        # scoring seed differs from the training one: unseen rows, some unseen categories
+        records = synthetic.synthetic_transactions(max(args.rows), args.seed + 1)
+        check_parity(records[:20], ctx)
+
+        results = []
+        for n in args.rows:
+            repeat = max(2, args.repeat if n < 10000 else args.repeat // 2)
+            for stage, fn in stages(records[:n], ctx).items():
+                with np.errstate(all="ignore"):
+                    seconds = time_call(fn, repeat)
+                results.append({
+                    "rows": n,
+                    "stage": stage,
+                    "ms": round(seconds * 1000, 3),
+                    "us_per_row": round(seconds * 1e6 / n, 2),
+                })
+        main_seconds = time_call(lambda: run_main(records[0]), args.repeat)
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "models": "real" if args.real_models else "stand-in",
+        "model_source": ctx["model_source"],
+        "tree_engine": ctx["tree_engine"],
+        "results": results,
+        "main_ms": round(main_seconds * 1000, 3),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
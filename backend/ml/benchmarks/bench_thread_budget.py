@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: scoring throughput vs the number of scoring processes, with the thread budget
+(THREAD_BUDGET) at auto and with every library at its own thread default.
+
+    python benchmarks/bench_thread_budget.py [--workers 1 2 4] [--rows 20000] [--budgets auto library]
+
+Records are variations of the startup-profile transaction (accounts, amounts, currencies,
+payment formats and incomes changed per row). For each budget and worker count, times
+score_records_parallel (--workers 1 scores in this process) including the model loading
+and pool start-up, after one warm-up run, and checks that every configuration returns the
+same predictions. Prints one JSON document with rows per second.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import predict  # noqa: E402
+
+CURRENCIES = ["US Dollar", "Euro", "Yuan", "Bitcoin", "UK Pound"]
+FORMATS = ["Cheque", "ACH", "Wire", "Credit Card", "Cash", "Reinvestment", "Bitcoin"]
+
+
+def synthetic_records(n, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n):
+        tx = dict(predict._PROFILE_TRANSACTION)
+        amount = round(rng.lognormvariate(7, 2), 2)
+        tx.update({
+            "fromAccount": f"{rng.randrange(16 ** 8):08X}",
+            "toAccount": f"{rng.randrange(16 ** 8):08X}",
+            "amount": amount,
+            "amountReceived": amount,
+            "paymentCurrency": rng.choice(CURRENCIES),
+            "receivingCurrency": rng.choice(CURRENCIES),
+            "paymentFormat": rng.choice(FORMATS),
+            "monthlyIncome": rng.choice([1500, 3000, 5000, 12000]),
+        })
+        records.append(tx)
+    return records
+
+
+def score(records, workers):
+    if workers == 1:
+        ctx = predict.apply_thread_budget(predict.load_scoring_context(), predict.resolve_thread_budget(1))
+        return predict.score_records_chunked(records, ctx)
+    return predict.score_records_parallel(records, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--budgets", nargs="+", default=["auto", "library"])
+    args = parser.parse_args()
+
+    predict.SAVE_TO_DB = predict.USE_DB_FEATURES = False
+    records = synthetic_records(args.rows)
+    reference = None
+    results = []
+    for budget in args.budgets:
+        predict.THREAD_BUDGET = budget
+        for workers in args.workers:
+            predict.SCORING_WORKERS = workers
+            score(records[:200], workers)
+            t = time.perf_counter()
+            out = score(records, workers)
+            seconds = time.perf_counter() - t
+            predictions = [r.get("prediction") for r in out]
+            if reference is None:
+                reference = predictions
+            assert predictions == reference, (budget, workers)
+            results.append({
+                "budget": budget,
+                "workers": workers,
+                "threads": predict.resolve_thread_budget(workers),
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(len(records) / seconds, 1),
+            })
+
+    print(json.dumps({"benchmark": "thread_budget", "cores": os.cpu_count(), "rows": args.rows,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
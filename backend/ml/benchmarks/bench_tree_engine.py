@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: NumPy flattened forests (tree_engine.FlatForest, NUMPY_TREE_MODELS) vs the
+library predict_proba of the Random Forest and XGBoost base models in models/. Also checks
+that both give the same probabilities within tree_engine.RF_TOLERANCE / XGB_TOLERANCE.
+
+    python benchmarks/bench_tree_engine.py [--rows 1 100 10000] [--repeat 20]
+
+Rows are synthetic: values drawn around every split threshold of both models, a quarter
+of them exactly on a threshold (ties decide between <= and <), plus some NaN.
+Prints one JSON document with timings per model and batch size.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import predict  # noqa: E402
+import tree_engine  # noqa: E402
+
+
+def synthetic_frame(n_rows, feature_names, forests, seed=0, nan_fraction=0.01):
+    """float32 DataFrame hitting both sides of every split, exact thresholds and missing values."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i, name in enumerate(feature_names):
+        thresholds = np.concatenate([
+            f.threshold[(f.feature == i) & (f.child != np.arange(f.n_nodes))].astype(np.float64)
+            for f in forests
+        ])
+        if not len(thresholds):
+            thresholds = np.array([0.0, 1.0])
+        vals = rng.uniform(thresholds.min() - 1, thresholds.max() + 1, n_rows)
+        on_split = rng.random(n_rows) < 0.25
+        vals[on_split] = rng.choice(thresholds, on_split.sum())
+        vals[rng.random(n_rows) < nan_fraction] = np.nan
+        data[name] = vals.astype(np.float32)
+    return pd.DataFrame(data)
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    _, xgb_model, rf_model, _, _ = predict.load_ensemble_models()
+    models = {"rf": rf_model, "xgb": xgb_model}
+    forests = predict.flatten_tree_models(models)
+    tolerance = {"rf": tree_engine.RF_TOLERANCE, "xgb": tree_engine.XGB_TOLERANCE}
+    feature_names = forests["rf"].feature_names or forests["xgb"].feature_names
+
+    # parity on a larger sample, with and without missing values
+    sample = synthetic_frame(max(args.rows + [20000]), feature_names, forests.values())
+    parity = {}
+    for name, forest in forests.items():
+        diffs = [
+            float(np.abs(models[name].predict_proba(X)[:, 1] - forest.predict_proba(X)[:, 1]).max())
+            for X in (sample, sample.fillna(0))
+        ]
+        assert max(diffs) <= tolerance[name], (name, diffs)
+        parity[name] = {"max_abs_diff": max(diffs), "tolerance": tolerance[name],
+                        "trees": forest.n_trees, "nodes": forest.n_nodes, "depth": forest.depth}
+
+    results = []
+    for n in args.rows:
+        X = sample.fillna(0).iloc[:n]
+        for name, forest in forests.items():
+            repeat = max(3, args.repeat if n < 10000 else args.repeat // 4)
+            t_native = time_call(lambda: models[name].predict_proba(X), repeat)
+            t_numpy = time_call(lambda: forest.predict_proba(X), repeat)
+            results.append({
+                "rows": n,
+                "model": name,
+                "native_ms": round(t_native * 1000, 3),
+                "numpy_ms": round(t_numpy * 1000, 3),
+                "speedup": round(t_native / t_numpy, 2) if t_numpy > 0 else None,
+            })
+
+    print(json.dumps({"benchmark": "tree_engine", "parity": parity, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Stand-in models and synthetic transactions for benchmarking predict.py without the private
+models/ directory.
+
+    python benchmarks/synthetic.py OUTPUT_DIR [--rows 5000] [--seed 0]
+
+train_stand_in_models() generates transactions covering every FEATURE_MAP field, runs them
+through the real feature pipeline (normalize_input, compute_engineered_features, apply_bins,
+encoding) and fits small CatBoost / XGBoost / Random Forest models and one LabelEncoder per
+string categorical on the result, so the feature names, order and dtypes are exactly those
+predict.py scores. The labels are a noisy rule over the amount-to-income ratio, PEP flag and
+KYC score: the models are only meant to have realistic size and shape, not skill.
+use_models() points predict at such a directory instead of models/.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import predict  # noqa: E402
+
+CURRENCIES = ["US Dollar", "Euro", "Indian Rupee", "UK Pound", "Yen", "Yuan", "Bitcoin"]
+PAYMENT_FORMATS = ["ACH", "Cash", "Cheque", "Credit Card", "Wire", "Reinvestment", "Bitcoin"]
+NATIONALITIES = ["India", "USA", "UK", "Germany", "France", "Nigeria", "Brazil"]
+OCCUPATIONS = ["Engineer", "Doctor", "Student", "Teacher", "Trader", "Retired", "Unemployed"]
+KYC_STATUSES = ["Verified", "Pending", "Rejected"]
+# string categoricals encoded by the LabelEncoders, as named after prepare_features_for_model
+ENCODED_COLUMNS = {
+    "Receiving Currency": "receiving_currency",
+    "Payment Currency": "payment_currency",
+    "Payment Format": "payment_format",
+    "nationality": "nationality",
+    "occupation": "occupation",
+    "kyc_status": "kyc_status",
+}
+
+# sizes of the stand-in models: a few seconds to train, megabytes on disk
+CAT_PARAMS = {"iterations": 200, "depth": 6, "verbose": 0, "random_seed": 0, "allow_writing_files": False}
+XGB_PARAMS = {"n_estimators": 100, "max_depth": 6, "random_state": 0}
+RF_PARAMS = {"n_estimators": 100, "max_depth": 12, "random_state": 0}
+
+
+def synthetic_transactions(n, seed=0, unseen_fraction=0.02):
+    """
+    n raw transactions in the UI format, with every FEATURE_MAP field set. A small fraction
+    of the categorical values is outside the training vocabulary, to exercise the encoder
+    fallbacks.
+    """
+    rng = random.Random(seed)
+    today = date(2025, 1, 1)
+
+    def pick(values):
+        return "Unseen" if rng.random() < unseen_fraction else rng.choice(values)
+
+    records = []
+    for _ in range(n):
+        amount = round(rng.lognormvariate(7, 2.2), 2)
+        income = round(rng.lognormvariate(8, 1), 2)
+        receive_count = rng.randrange(0, 500)
+        total_received = round(amount * max(1, receive_count) * rng.uniform(0.5, 2), 2)
+        unique_senders = rng.randrange(0, max(1, receive_count) + 1)
+        records.append({
+            "fromBank": str(rng.randrange(1, 400)),
+            "fromAccount": f"{rng.randrange(16 ** 9):09X}",
+            "toBank": str(rng.randrange(1, 400)),
+            "toAccount": f"{rng.randrange(16 ** 9):09X}",
+            "amount": amount,
+            "amountReceived": round(amount * rng.choice([1, 1, 1, rng.uniform(0.8, 1.2)]), 2),
+            "paymentCurrency": pick(CURRENCIES),
+            "receivingCurrency": pick(CURRENCIES),
+            "paymentFormat": pick(PAYMENT_FORMATS),
+            "fullName": f"Customer {rng.randrange(10 ** 6)}",
+            "nationality": pick(NATIONALITIES),
+            "occupation": pick(OCCUPATIONS),
+            "kycStatus": pick(KYC_STATUSES),
+            "kycScore": rng.randrange(0, 101),
+            "isPep": int(rng.random() < 0.05),
+            "monthlyIncome": income,
+            "dob": (today - timedelta(days=rng.randrange(18 * 365, 85 * 365))).isoformat(),
+            "customerSince": (today - timedelta(days=rng.randrange(0, 20 * 365))).isoformat(),
+            "txnCountLast7Days": rng.randrange(0, 60),
+            "totalAmountLast30Days": round(amount * rng.uniform(1, 40), 2),
+            "daysSinceLastTxn": rng.randrange(0, 25),
+            "beneficiaryReceiveCount": receive_count,
+            "beneficiaryTotalReceived": total_received,
+            "beneficiaryAvgReceivedAmount": round(total_received / max(1, receive_count), 2),
+            "beneficiaryUniqueSenders": unique_senders,
+            "beneficiaryUniqueSenderNationalitiesSoFar": min(unique_senders, rng.randrange(0, 8)),
+            "beneficiaryPepSenderCountAtTimeOfTxn": rng.randrange(0, 3),
+            "beneficiaryUniqueSendersAtTimeOfTxn": unique_senders,
+            "beneficiaryReceiveCountSoFar": receive_count,
+            "beneficiaryTotalReceivedSoFar": total_received,
+        })
+    missing = set(predict.FEATURE_MAP) - set(records[0]) if records else set()
+    assert not missing, f"synthetic transactions miss FEATURE_MAP fields: {sorted(missing)}"
+    return records
+
+
+def engineered_frame(records, now=None):
+    """The feature frame score_batch builds from raw records (before binning and encoding)."""
+    rows = [predict.compute_engineered_features(predict.normalize_input(r), now) for r in records]
+    return predict.pd.DataFrame(rows)
+
+
+def encoder_input(df):
+    """The string categorical columns of an engineered frame under their encoder names."""
+    return {col: df[src] for col, src in ENCODED_COLUMNS.items() if src in df.columns}
+
+
+def synthetic_labels(df, seed=0):
+    rng = np.random.default_rng(seed)
+    ratio = predict.pd.to_numeric(df["amount_to_income_ratio"], errors="coerce").fillna(0).to_numpy()
+    risky = (ratio > 5) | (df["is_pep"].astype(int).to_numpy() == 1) | (df["kyc_score"].to_numpy() < 15)
+    # 10% label noise so the trees grow to their full size
+    return (risky ^ (rng.random(len(df)) < 0.1)).astype(int)
+
+
+def training_data(n_rows=5000, seed=0) -> tuple:
+    """(X, y, encoders): model features of n_rows synthetic transactions, their labels and the fitted LabelEncoders."""
+    from sklearn.preprocessing import LabelEncoder
+
+    df = engineered_frame(synthetic_transactions(n_rows, seed, unseen_fraction=0))
+    encoders = {
+        col: LabelEncoder().fit(values.astype(str).tolist() + ["Unknown"])
+        for col, values in encoder_input(df).items()
+    }
+    X = predict.prepare_features_for_model(df, predict.compile_encoders(encoders))
+    return X, synthetic_labels(df, seed), encoders
+
+
+def train_stand_in_models(out_dir, n_rows=5000, seed=0) -> dict:
+    """Fit and save the stand-in models, encoders and stacking config in out_dir; returns the file paths."""
+    from catboost import CatBoostClassifier
+    from sklearn.ensemble import RandomForestClassifier
+    from xgboost import XGBClassifier
+
+    os.makedirs(out_dir, exist_ok=True)
+    X, y, encoders = training_data(n_rows, seed)
+
+    paths = {
+        "cat_model": os.path.join(out_dir, os.path.basename(predict.CAT_MODEL_PATH)),
+        "xgb_model": os.path.join(out_dir, os.path.basename(predict.XGB_MODEL_PATH)),
+        "rf_model": os.path.join(out_dir, os.path.basename(predict.RF_MODEL_PATH)),
+        "encoder": os.path.join(out_dir, os.path.basename(predict.ENCODER_PATH)),
+        "stacking_config": os.path.join(out_dir, os.path.basename(predict.STACKING_CONFIG_PATH)),
+    }
+    CatBoostClassifier(**CAT_PARAMS).fit(X, y).save_model(paths["cat_model"])
+    joblib.dump(XGBClassifier(**XGB_PARAMS).fit(X, y), paths["xgb_model"])
+    joblib.dump(RandomForestClassifier(**RF_PARAMS).fit(X, y), paths["rf_model"])
+    joblib.dump(encoders, paths["encoder"])
+    joblib.dump({"base_model_order": ["xgb", "rf", "cat"], "decision_threshold": 0.5}, paths["stacking_config"])
+    return paths
+
+
+def use_models(model_dir):
+    """Make predict load its models from model_dir (loose files, never a compiled bundle)."""
+    predict.MODELS_DIR = model_dir
+    for attr in ("CAT_MODEL_PATH", "XGB_MODEL_PATH", "RF_MODEL_PATH", "ENCODER_PATH", "STACKING_CONFIG_PATH"):
+        setattr(predict, attr, os.path.join(model_dir, os.path.basename(getattr(predict, attr))))
+    predict.USE_MODEL_BUNDLE = "false"
+    predict.SAVE_TO_DB = predict.USE_DB_FEATURES = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train stand-in models for the benchmarks")
+    parser.add_argument("output", help="directory for the model files")
+    parser.add_argument("--rows", type=int, default=5000, help="synthetic training transactions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, path in train_stand_in_models(args.output, args.rows, args.seed).items():
+        print(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
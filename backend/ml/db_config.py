@@ -1,4 +1,10 @@
+import atexit
+import collections
+import contextlib
 import os
+import threading
+import time
+
 import pymysql
 
 
@@ -17,3 +23,227 @@ def get_db_config():
 def get_connection():
     cfg = get_db_config()
     return pymysql.connect(host=cfg["host"], port=cfg["port"], user=cfg["user"], password=cfg["password"], database=cfg["database"], cursorclass=pymysql.cursors.DictCursor)
+
+
+def get_pool_config():
+    return {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 1)),
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 5)),
+        # idle connections above min_size are closed after this many seconds
+        "idle_timeout": float(os.environ.get("DB_POOL_IDLE_TIMEOUT", 300)),
+        # how long acquire() waits for a free connection when max_size are checked out
+        "checkout_timeout": float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 10)),
+        # connections idle for longer than this are pinged on checkout
+        "ping_interval": float(os.environ.get("DB_POOL_PING_INTERVAL", 5)),
+    }
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of pymysql connections (DictCursor, autocommit so a reused
+    connection never holds an old read snapshot).
+
+    - at most max_size connections exist; acquire() waits up to checkout_timeout
+    - a connection idle for ping_interval seconds is pinged on checkout and replaced
+      if the ping fails; one that raised a connection error is discarded on release
+    - idle connections beyond min_size are closed after idle_timeout seconds
+    - stats() reports checkouts, waits, created/destroyed and current sizes
+    """
+
+    def __init__(self, min_size=1, max_size=5, idle_timeout=300.0, checkout_timeout=10.0,
+                 ping_interval=5.0, connect=None):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self._connect = connect or self._default_connect
+        self._cond = threading.Condition()
+        # (connection, last_used) pairs; most recently used at the right
+        self._idle = collections.deque()
+        self._size = 0
+        self._closed = False
+        self.pid = os.getpid()
+        self.created = 0
+        self.destroyed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.failed_pings = 0
+        self.connect_errors = 0
+
+    @staticmethod
+    def _default_connect():
+        cfg = get_db_config()
+        return pymysql.connect(host=cfg["host"], port=cfg["port"], user=cfg["user"], password=cfg["password"],
+                               database=cfg["database"], charset=cfg["charset"],
+                               cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+
+    def _new_connection(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.connect_errors += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _destroy(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self.destroyed += 1
+            self._cond.notify()
+
+    def _expired_idle(self, now):
+        """Remove idle connections past idle_timeout (oldest first), keeping min_size; the caller holds the lock and closes them."""
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self.destroyed += 1
+        return expired
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("connection pool is closed")
+            expired = self._expired_idle(time.monotonic())
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                if waited is None:
+                    waited = time.monotonic()
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"no database connection available within {timeout}s (max_size={self.max_size})")
+                self._cond.wait(remaining)
+            if waited is not None:
+                self.wait_seconds += time.monotonic() - waited
+            self.checkouts += 1
+        for old in expired:
+            self._close_quietly(old)
+
+        if conn is None:
+            return self._new_connection()
+        if time.monotonic() - last_used >= self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                # reconnect: replace the dead connection, keeping its slot
+                self._close_quietly(conn)
+                with self._cond:
+                    self.failed_pings += 1
+                    self.destroyed += 1
+                return self._new_connection()
+        return conn
+
+    def release(self, conn, discard=False):
+        if discard or self._closed or self.pid != os.getpid() or not getattr(conn, "open", True):
+            self._destroy(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._destroy(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self.created,
+                "destroyed": self.destroyed,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 6),
+                "timeouts": self.timeouts,
+                "failed_pings": self.failed_pings,
+                "connect_errors": self.connect_errors,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide ConnectionPool (DB_POOL_* settings). A forked child gets its own pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            # never close an inherited pool: its sockets belong to the parent process
+            _pool = ConnectionPool(**get_pool_config())
+        return _pool
+
+
+def pooled_connection():
+    """Context manager yielding a pooled connection: `with db_config.pooled_connection() as conn: ...`"""
+    return get_pool().connection()
+
+
+def pool_stats():
+    """Metrics of the process pool, or None if no pooled connection was used yet."""
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        return None
+    return pool.stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+atexit.register(close_pool)
@@ -0,0 +1,155 @@
+"""
+Compiled model bundle for predict.py: the models, encoders and scoring configuration in
+one versioned directory, written once by `predict.py compile-bundle` and loaded at start-up
+instead of the loose files in models/.
+
+    <bundle>/manifest.json   format version, library versions, sha256 of every bundle file,
+                             size / mtime / sha256 of the source files it was built from,
+                             and the JSON-serialisable configuration (feature order, bins, ...)
+    <bundle>/objects.joblib  Python objects (uncompressed joblib, loaded with mmap_mode="r":
+                             numpy arrays inside are memory-mapped, not copied, so worker
+                             processes share their pages through the page cache)
+    <bundle>/<name>          raw files copied as-is (e.g. the CatBoost .cbm)
+
+Nothing here knows about the models themselves; predict.py decides what goes in.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import joblib
+
+BUNDLE_FORMAT = "aml-ensemble-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+OBJECTS_NAME = "objects.joblib"
+
+# libraries whose pickles are version-sensitive; recorded in the manifest
+TRACKED_LIBRARIES = ("numpy", "sklearn", "xgboost", "catboost", "joblib")
+
+
+class BundleError(RuntimeError):
+    """The bundle is missing, corrupt, stale or from another format version."""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_info(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(path)}
+
+
+def library_versions() -> dict:
+    versions = {"python": sys.version.split()[0]}
+    for name in TRACKED_LIBRARIES:
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, "__version__", None)
+    return versions
+
+
+def write_bundle(path: str, objects: dict, files: dict, config: dict, sources: dict) -> dict:
+    """
+    Write a bundle directory atomically (built next to `path`, then renamed over it).
+
+    objects: name -> Python object, pickled together into objects.joblib
+    files:   bundle file name -> existing file to copy in
+    config:  JSON-serialisable settings stored in the manifest
+    sources: name -> source file the bundle was built from (checksummed for staleness checks)
+    Returns the manifest.
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", dir=parent)
+    try:
+        joblib.dump(objects, os.path.join(staging, OBJECTS_NAME))
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(staging, name))
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "libraries": library_versions(),
+            "files": {name: file_sha256(os.path.join(staging, name)) for name in [OBJECTS_NAME, *files]},
+            "sources": {name: _source_info(src) for name, src in sources.items()},
+            "config": config,
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        if os.path.isdir(path):
+            old = path + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            os.rename(path, old)
+            os.rename(staging, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise BundleError(f"no model bundle at {path}")
+    with open(manifest_path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("format") != BUNDLE_FORMAT or manifest.get("version") != BUNDLE_VERSION:
+        raise BundleError(
+            f"unsupported bundle {manifest.get('format')} v{manifest.get('version')} "
+            f"(expected {BUNDLE_FORMAT} v{BUNDLE_VERSION}); rebuild it with compile-bundle"
+        )
+    return manifest
+
+
+def stale_sources(manifest: dict) -> list:
+    """Source files that changed since the bundle was built (size or mtime differ). Missing ones are not stale."""
+    stale = []
+    for name, info in manifest.get("sources", {}).items():
+        try:
+            st = os.stat(info["path"])
+        except OSError:
+            continue
+        if st.st_size != info["size"] or st.st_mtime_ns != info["mtime_ns"]:
+            stale.append(name)
+    return stale
+
+
+def verify_files(path: str, manifest: dict):
+    """Raise BundleError unless every bundle file matches its manifest checksum."""
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise BundleError(f"bundle file {name} is missing")
+        if file_sha256(file_path) != expected:
+            raise BundleError(f"checksum mismatch for bundle file {name}")
+
+
+def load_objects(path: str, mmap: bool = True) -> dict:
+    """
+    The objects of a bundle. mmap memory-maps the numpy arrays in objects.joblib read-only
+    instead of reading them into private memory (objects that copy their arrays on
+    unpickling, like scikit-learn trees, still get private copies).
+    """
+    return joblib.load(os.path.join(path, OBJECTS_NAME), mmap_mode="r" if mmap else None)
+
+
+def load_bundle(path: str, verify: bool = True, mmap: bool = True) -> tuple:
+    """(manifest, objects) of a bundle, checking the sha256 of every file first when verify is set; raw files are at os.path.join(path, name)."""
+    manifest = read_manifest(path)
+    if verify:
+        verify_files(path, manifest)
+    return manifest, load_objects(path, mmap)
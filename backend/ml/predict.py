@@ -1,26 +1,75 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
+import time
+_STARTED = time.perf_counter()
+
 import sys
 import json
 import os
 from datetime import datetime
 import traceback
+import io
+import contextlib
+import functools
+import argparse
+import csv
+import collections
+import concurrent.futures
+import multiprocessing
+import gc
+import uuid
+import threading
+import atexit
+import logging
+import importlib
+
+# -----------------------
+# heavy imports: pandas, numpy and joblib are imported on first use (catboost, and
+# xgboost / sklearn through joblib, when the models are loaded), so usage and input
+# errors are answered without paying for them. `--startup-profile` reports the cost.
+# -----------------------
+class _LazyModule:
+    """Stand-in for a module: the first attribute access imports it and rebinds the global name."""
+
+    def __init__(self, module_name: str, global_name: str):
+        self._module_name = module_name
+        self._global_name = global_name
 
-import pandas as pd
-import numpy as np
-import joblib
-from catboost import CatBoostClassifier
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._module_name)
+        globals()[self._global_name] = module
+        return getattr(module, attr)
+
+pd = _LazyModule("pandas", "pd")
+np = _LazyModule("numpy", "np")
+joblib = _LazyModule("joblib", "joblib")
 
 # ----- CONFIG -----
-# Ensemble model paths (4 base models + 1 stacking model)
+# Ensemble model paths (3 base models; the stacking meta-model is not used by the decision rule)
 MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
 CAT_MODEL_PATH = os.path.join(MODELS_DIR, "cat_model.cbm")
 XGB_MODEL_PATH = os.path.join(MODELS_DIR, "xgb_model.pkl")
 RF_MODEL_PATH = os.path.join(MODELS_DIR, "rf_model.pkl")
-STACKED_MODEL_PATH = os.path.join(MODELS_DIR, "stacked_meta_model.pkl")
 ENCODER_PATH = os.path.join(MODELS_DIR, "categorical_encoders.pkl")
 STACKING_CONFIG_PATH = os.path.join(MODELS_DIR, "stacking_config.pkl")
+# compiled bundle of the models, encoders and scoring configuration (`predict.py compile-bundle`)
+MODEL_BUNDLE_PATH = os.environ.get("MODEL_BUNDLE_PATH", os.path.join(MODELS_DIR, "ensemble_bundle"))
+# auto: load the bundle when it exists and is up to date, else the loose files;
+# true: the bundle is required; false: always load the loose files
+USE_MODEL_BUNDLE = os.environ.get("USE_MODEL_BUNDLE", "auto").strip().lower()
+# check the sha256 of every bundle file before loading it
+MODEL_BUNDLE_VERIFY = os.environ.get("MODEL_BUNDLE_VERIFY", "true").strip().lower() == "true"
+# base models scored by the pure-NumPy flattened forests of tree_engine.py instead of their
+# library (comma list of rf, xgb; empty: library only). Batches of more than
+# NUMPY_TREE_MAX_ROWS rows still go to the library, which is faster there (0: no limit).
+NUMPY_TREE_MODELS = tuple(m.strip().lower() for m in os.environ.get("NUMPY_TREE_MODELS", "").split(",") if m.strip())
+NUMPY_TREE_MAX_ROWS = int(os.environ.get("NUMPY_TREE_MAX_ROWS", "1000"))
 SAVE_TO_DB = os.environ.get("SAVE_TO_DB", "false").strip().lower() == "true"
 USE_DB_FEATURES = os.environ.get("USE_DB_FEATURES", "false").strip().lower() == "true"
+# stderr log level (DEBUG, INFO, WARNING, ERROR). Debug dumps are only built when DEBUG is
+# enabled, here or for one request ("_debug": true).
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
 
 # # (bins_config, categorical_features, numeric_features copied from your snippet)
 # bins_config = {
@@ -209,78 +258,144 @@ def prepare_bins(edges):
         edges = edges + [float("inf")]
     return edges
 
+def compile_bins(bins_dict):
+    """Turn a bins config into contiguous float64 edge arrays (sorted, de-duplicated, +inf terminated)."""
+    return {feature: np.asarray(prepare_bins(edges), dtype=np.float64) for feature, edges in bins_dict.items()}
+
+@functools.lru_cache(maxsize=None)
+def default_compiled_bins():
+    """Edges of bins_config, compiled once on first use."""
+    return compile_bins(bins_config)
+
+def bin_values(values, edges, log_scale=False):
+    """
+    Bin ids (1..len(edges)-1) for a float array, matching
+    pd.cut(vals, edges, labels=1.., include_lowest=True, right=True) on values clipped to edges[0]:
+    value v gets bin i when edges[i-1] < v <= edges[i]; anything at or below edges[0] gets bin 1.
+    Returns (ids, mask) where mask marks values that cannot be binned (NaN after log1p).
+    """
+    if log_scale:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.log1p(values)
+    ids = np.searchsorted(edges, values, side="left")
+    np.maximum(ids, 1, out=ids)
+    return ids, np.isnan(values)
+
 def apply_bins(df, bins_dict, log_bin_features=None):
     """
     Apply binning to df based on bins_dict.
     For features listed in log_bin_features, bin log1p(values) AGAINST EDGES ALREADY PROVIDED IN LOG SCALE.
     Important: Do NOT log-transform edges; they are assumed to be in log space already.
+    Values below the first edge fall into bin 1 (per value, so a row's bin never depends on
+    the other rows of a batch). Non-numeric values count as 0.
+    Edges come from default_compiled_bins() when bins_dict is bins_config, so nothing is rebuilt per call.
     """
     if log_bin_features is None:
         log_bin_features = []
-    binned_df = df.copy()
-    for feature, edges in bins_dict.items():
-        if feature not in binned_df.columns:
+    compiled = default_compiled_bins() if bins_dict is bins_config else compile_bins(bins_dict)
+    new_cols = {}
+    for feature, edges in compiled.items():
+        if feature not in df.columns:
             # skip silently if feature not present
             continue
 
-        # Prepare values
-        vals = pd.to_numeric(binned_df[feature], errors="coerce").fillna(0)
-
-        # Prepare edges
-        raw_edges = prepare_bins(edges)
-
-        if feature in log_bin_features:
-            # Transform values to log scale; use edges as provided (already in log space)
-            vals = np.log1p(vals)
-            edges_to_use = raw_edges
-            # Ensure -inf coverage if needed
-            if edges_to_use[0] > -np.inf and vals.min(skipna=True) < edges_to_use[0]:
-                edges_to_use = [-float("inf")] + edges_to_use
-            labels = range(1, len(edges_to_use))
-            binned_col = pd.cut(
-                vals,
-                bins=edges_to_use,
-                labels=labels,
-                include_lowest=True,
-                right=True
-            )
+        col = df[feature]
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            vals = col.to_numpy(dtype=np.float64, na_value=np.nan)
         else:
-            # Binning on raw scale
-            edges_to_use = raw_edges
-            if edges_to_use[0] > -np.inf and vals.min(skipna=True) < edges_to_use[0]:
-                edges_to_use = [-float("inf")] + edges_to_use
-            labels = range(1, len(edges_to_use))
-            binned_col = pd.cut(
-                vals,
-                bins=edges_to_use,
-                labels=labels,
-                include_lowest=True,
-                right=True
-            )
+            vals = pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        vals = np.where(np.isnan(vals), 0.0, vals)
 
-        binned_df[feature + "_binned"] = binned_col.astype("Int64")
-    return binned_df
+        ids, mask = bin_values(vals, edges, feature in log_bin_features)
+        new_cols[feature + "_binned"] = pd.arrays.IntegerArray(ids.astype(np.int64), mask)
+
+    # Attach all *_binned columns in one step; the input frame is never modified
+    if any(c in df.columns for c in new_cols):
+        # keep the position of pre-existing *_binned columns
+        binned_df = df.copy(deep=False)
+        for c, v in new_cols.items():
+            binned_df[c] = v
+        return binned_df
+    return pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1)
 
 # -----------------------
-# helpers: debug printing
+# logging: "[LEVEL] message" lines on stderr
 # -----------------------
-def _print_feature_block(title: str, df: pd.DataFrame, columns: list | None = None):
+log = logging.getLogger("predict")
+
+class _LogFormatter(logging.Formatter):
+    LEVEL_TAGS = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+    def format(self, record):
+        line = f"[{self.LEVEL_TAGS.get(record.levelname, record.levelname)}] {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is at the time (so redirect_stderr still captures it)."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+_LOG_HANDLER = _StderrHandler()
+_LOG_HANDLER.setFormatter(_LogFormatter())
+
+def configure_logging(level: str | int = None):
+    """Set the stderr log level (default LOG_LEVEL); unknown names fall back to INFO."""
+    level = level or LOG_LEVEL
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        level = level if isinstance(level, int) else logging.INFO
+    if _LOG_HANDLER not in log.handlers:
+        log.addHandler(_LOG_HANDLER)
+    log.propagate = False
+    log.setLevel(level)
+    _LOG_HANDLER.setLevel(level)
+
+configure_logging()
+
+@contextlib.contextmanager
+def capture_debug_log():
+    """
+    Enable DEBUG for the duration and collect everything logged meanwhile in the yielded
+    StringIO (serve "_debug" requests). stderr keeps its configured level.
+    """
+    buf = io.StringIO()
+    handler = logging.StreamHandler(buf)
+    handler.setFormatter(_LogFormatter())
+    previous = log.level
+    log.addHandler(handler)
+    log.setLevel(logging.DEBUG)
     try:
-        print(f"\n=== {title} ===", file=sys.stderr)
+        yield buf
+    finally:
+        log.setLevel(previous)
+        log.removeHandler(handler)
+
+def debug_enabled() -> bool:
+    return log.isEnabledFor(logging.DEBUG)
+
+def _log_feature_block(title: str, df: pd.DataFrame, columns: list | None = None):
+    """Debug dump of the first row of df (all columns sorted, or the given columns); call only when debug_enabled()."""
+    try:
+        lines = [f"=== {title} ==="]
         if columns is None:
-            # Print all columns sorted for determinism
-            row_dict = df.iloc[0].to_dict()
-            for key, value in sorted(row_dict.items()):
-                print(f"{key}: {value}", file=sys.stderr)
+            # all columns sorted for determinism
+            lines += [f"{key}: {value}" for key, value in sorted(df.iloc[0].to_dict().items())]
         else:
             cols = [c for c in columns if c in df.columns]
-            print(f"Columns: {cols}", file=sys.stderr)
+            lines.append(f"Columns: {cols}")
             if cols:
-                print(f"Values: {df[cols].values[0].tolist()}", file=sys.stderr)
+                lines.append(f"Values: {df[cols].values[0].tolist()}")
+        log.debug("\n".join(lines))
     except Exception as e:
-        # Log the error so we can diagnose silently failing prints
-        print(f"[ERROR] Failed to print feature block '{title}': {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        log.exception("Failed to print feature block '%s': %s", title, e)
 
 # -----------------------
 # mapping UI->model
@@ -324,117 +439,125 @@ FEATURE_MAP = {
     "beneficiaryTotalReceivedSoFar": "beneficiary_total_received_so_far",
 }
 
+# -----------------------
+# sender / beneficiary history (USE_DB_FEATURES): in-process feature store
+# -----------------------
+_FEATURE_STORE = None
+
+def get_feature_store():
+    """Process-wide FeatureStore; accounts are hydrated from the DB on first use and then served from memory."""
+    global _FEATURE_STORE
+    if _FEATURE_STORE is None:
+        import feature_store
+        _FEATURE_STORE = feature_store.FeatureStore()
+    return _FEATURE_STORE
+
+def _history_accounts(row: dict) -> tuple:
+    """(sender account, beneficiary account) of a mapped transaction (None when missing)."""
+    return (row.get("account") or row.get("fromAccount") or None,
+            row.get("account_1") or row.get("toAccount") or None)
+
+def prefetch_history(rows: list, now: datetime | None = None):
+    """Load the sender/beneficiary history of a batch with IN (...) queries before its rows are engineered."""
+    if not USE_DB_FEATURES or not rows:
+        return
+    try:
+        accounts = [_history_accounts(r) for r in rows]
+        get_feature_store().prefetch([a for a, _ in accounts], [b for _, b in accounts], now)
+    except Exception as e:
+        log.warning("Failed to prefetch feature history: %s", e)
+
+def hold_history(row: dict):
+    """Keep the feature store entries of a row queued on the PredictionWriter loaded until it is written."""
+    if not USE_DB_FEATURES:
+        return
+    try:
+        get_feature_store().hold(row)
+    except Exception as e:
+        log.warning("Failed to pin feature store entries: %s", e)
+
+def release_history(rows: list):
+    """PredictionWriter callback: rows written (or spilled) no longer pin their feature store entries."""
+    if _FEATURE_STORE is not None:
+        _FEATURE_STORE.release(rows)
+
+def record_persisted_transaction(row: dict, now: datetime | None = None):
+    """Apply a transaction that is being persisted (SAVE_TO_DB) to the loaded feature store entries."""
+    if not USE_DB_FEATURES:
+        return
+    try:
+        get_feature_store().record(row, now)
+    except Exception as e:
+        log.warning("Failed to update feature store: %s", e)
+
 # -----------------------
 # utility: compute sender-based features from historical data
 # -----------------------
-def compute_sender_features(row: dict, historical_df: pd.DataFrame) -> dict:
+SENDER_FEATURES = ("days_since_last_txn", "txn_count_last_7_days", "total_amount_last_30_days")
+BENEFICIARY_DEBUG_FEATURES = (
+    "beneficiary_receive_count", "beneficiary_total_received",
+    "beneficiary_unique_senders", "beneficiary_pep_sender_count_at_time_of_txn",
+)
+
+def _feature_summary(row: dict, keys) -> str:
+    return ", ".join(f"{k}={row.get(k, 'NOT SET')}" for k in keys)
+
+def compute_sender_features(row: dict, historical_df: pd.DataFrame = None, now: datetime | None = None) -> dict:
     """
-    Compute sender-based features from database:
+    Compute sender-based features from the sender's history (feature store, hydrated from the database):
     - days_since_last_txn: days since last transaction from same sender account
     - txn_count_last_7_days: number of transactions by sender in last 7 days
     - total_amount_last_30_days: total amount sent by sender in last 30 days
     """
-    print("\n[DEBUG] === COMPUTING SENDER FEATURES ===", file=sys.stderr)
-    now = datetime.now()
+    now = now or datetime.now()
     sender_account = row.get("account") or row.get("fromAccount")
-    print(f"[DEBUG] Sender account: {sender_account}", file=sys.stderr)
-    
-    # Fetch matching sender transactions from database
-    try:
-        import db_config
-        if sender_account:
-            sql = (
-                "SELECT account, account_1, amount, amount_received, timestamp, "
-                "is_pep, nationality, from_bank, account_number "
-                "FROM transaction WHERE account=%s OR account_number=%s "
-                "ORDER BY timestamp DESC LIMIT 500"
-            )
-            conn = db_config.get_connection()
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(sql, (sender_account, sender_account))
-                    rows = cur.fetchall()
-                if rows:
-                    historical_df = pd.DataFrame(rows)
-                else:
-                    historical_df = pd.DataFrame()
-            finally:
-                conn.close()
-        else:
-            historical_df = pd.DataFrame()
-    except Exception as e:
-        print(f"[WARN] Failed to fetch sender history from DB: {e}", file=sys.stderr)
-        historical_df = pd.DataFrame()
+    log.debug("=== COMPUTING SENDER FEATURES === account: %s", sender_account)
 
-    if not sender_account or historical_df.empty:
-        # For new accounts with no history, set meaningful defaults based on current transaction
-        row["days_since_last_txn"] = 0  # This is the first transaction
-        row["txn_count_last_7_days"] = 1  # Count this transaction
-        row["total_amount_last_30_days"] = float(row.get("amount") or 0)
-        return row
-    
     try:
-        # Filter transactions from this sender
-        account_col = "account" if "account" in historical_df.columns else "account_number"
-        sender_txns = historical_df[historical_df[account_col] == sender_account].copy()
-        
-        if not sender_txns.empty:
-            # Use timestamp column for date comparisons
-            if "timestamp" in sender_txns.columns:
-                sender_txns["transaction_date"] = pd.to_datetime(sender_txns["timestamp"], errors='coerce')
-            else:
-                # Use current date as placeholder if no date column
-                sender_txns["transaction_date"] = now
-            
-            # Sort by date descending
-            sender_txns = sender_txns.sort_values("transaction_date", ascending=False)
-            
-            # 1) Days since last transaction
-            last_txn_date = sender_txns["transaction_date"].iloc[0]
-            if pd.notna(last_txn_date):
-                days_diff = (now - last_txn_date).days
-                row["days_since_last_txn"] = max(0, days_diff)
-            else:
-                row["days_since_last_txn"] = 0
-            
-            # 2) Transactions in last 7 days
-            seven_days_ago = now - pd.Timedelta(days=7)
-            txns_last_7 = sender_txns[sender_txns["transaction_date"] >= seven_days_ago]
-            row["txn_count_last_7_days"] = len(txns_last_7)
-            
-            # 3) Total amount in last 30 days
-            thirty_days_ago = now - pd.Timedelta(days=30)
-            txns_last_30 = sender_txns[sender_txns["transaction_date"] >= thirty_days_ago]
-            if "amount" in txns_last_30.columns:
-                total_30 = pd.to_numeric(txns_last_30["amount"], errors='coerce').sum()
-                row["total_amount_last_30_days"] = float(total_30) if pd.notna(total_30) else 0
-            else:
-                row["total_amount_last_30_days"] = float(row.get("amount") or 0)
-        else:
-            # No transactions found in history, use current transaction as baseline
-            row["days_since_last_txn"] = 0
-            row["txn_count_last_7_days"] = 1
+        features = get_feature_store().sender_features(sender_account, now) if sender_account else None
+        if features is None:
+            # For new accounts with no history, set meaningful defaults based on current transaction
+            row["days_since_last_txn"] = 0  # This is the first transaction
+            row["txn_count_last_7_days"] = 1  # Count this transaction
             row["total_amount_last_30_days"] = float(row.get("amount") or 0)
+            return row
+        row.update(features)
     except Exception as e:
-        print(f"[WARN] Error computing sender features: {e}", file=sys.stderr)
+        log.warning("Error computing sender features: %s", e)
         # On error, use current transaction as baseline
         row["days_since_last_txn"] = 0
         row["txn_count_last_7_days"] = 1
         row["total_amount_last_30_days"] = float(row.get("amount") or 0)
-    
-    print(f"[DEBUG] Sender features computed:", file=sys.stderr)
-    print(f"[DEBUG]   days_since_last_txn = {row.get('days_since_last_txn', 'NOT SET')}", file=sys.stderr)
-    print(f"[DEBUG]   txn_count_last_7_days = {row.get('txn_count_last_7_days', 'NOT SET')}", file=sys.stderr)
-    print(f"[DEBUG]   total_amount_last_30_days = {row.get('total_amount_last_30_days', 'NOT SET')}", file=sys.stderr)
-    
+
+    if debug_enabled():
+        log.debug("Sender features computed: %s", _feature_summary(row, SENDER_FEATURES))
+
     return row
 
 # -----------------------
 # utility: compute beneficiary-based features from historical data
 # -----------------------
-def compute_beneficiary_features(row: dict, historical_df: pd.DataFrame) -> dict:
+def _first_beneficiary_features(row: dict) -> dict:
+    """Beneficiary features for a beneficiary without history, from the current transaction."""
+    current_amount = float(row.get("amount_received") or row.get("amount") or 0)
+    sender_account = row.get("account") or row.get("fromAccount") or ""
+    sender_nat = row.get("nationality") or "Unknown"
+    is_pep = int(row.get("is_pep") or 0)
+
+    row["beneficiary_receive_count"] = 1
+    row["beneficiary_total_received"] = current_amount
+    row["beneficiary_avg_received_amount"] = current_amount
+    row["beneficiary_unique_senders"] = 1 if sender_account else 0
+    row["beneficiary_unique_sender_nationalities_so_far"] = 1 if sender_nat != "Unknown" else 0
+    row["beneficiary_pep_sender_count_at_time_of_txn"] = is_pep
+    row["beneficiary_receive_count_so_far"] = 1
+    row["beneficiary_total_received_so_far"] = current_amount
+    row["beneficiary_unique_senders_at_time_of_txn"] = 1 if sender_account else 0
+    return row
+
+def compute_beneficiary_features(row: dict, historical_df: pd.DataFrame = None) -> dict:
     """
-    Compute beneficiary-based features:
+    Compute beneficiary-based features from the beneficiary's history (feature store, hydrated from the database):
     - beneficiary_receive_count: number of times this beneficiary received
     - beneficiary_total_received: total amount received by beneficiary
     - beneficiary_avg_received_amount: average amount received
@@ -445,167 +568,51 @@ def compute_beneficiary_features(row: dict, historical_df: pd.DataFrame) -> dict
     - beneficiary_total_received_so_far: same as total_received
     - beneficiary_unique_senders_at_time_of_txn: same as unique_senders
     """
-    print("\n[DEBUG] === COMPUTING BENEFICIARY FEATURES ===", file=sys.stderr)
     beneficiary_account = row.get("account_1") or row.get("toAccount")
-    print(f"[DEBUG] Beneficiary account: {beneficiary_account}", file=sys.stderr)
-    
-    # Fetch matching beneficiary transactions from database
-    try:
-        import db_config
-        if beneficiary_account:
-            sql = (
-                "SELECT account, to_bank_txn, account_1, from_bank, amount_received, amount, "
-                    "timestamp, is_pep, nationality "
-                "FROM transaction WHERE account_1=%s "
-                    "ORDER BY timestamp DESC LIMIT 500"
-            )
-            conn = db_config.get_connection()
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(sql, (beneficiary_account,))
-                    rows = cur.fetchall()
-                if rows:
-                    historical_df = pd.DataFrame(rows)
-                else:
-                    historical_df = pd.DataFrame()
-            finally:
-                conn.close()
-        else:
-            historical_df = pd.DataFrame()
-    except Exception as e:
-        print(f"[WARN] Failed to fetch beneficiary history from DB: {e}", file=sys.stderr)
-        historical_df = pd.DataFrame()
-
-    if not beneficiary_account or historical_df.empty:
-        # For new beneficiary with no history, calculate from current transaction
-        current_amount = float(row.get("amount_received") or row.get("amount") or 0)
-        sender_account = row.get("account") or row.get("fromAccount") or ""
-        sender_nat = row.get("nationality") or "Unknown"
-        is_pep = int(row.get("is_pep") or 0)
-        
-        row["beneficiary_receive_count"] = 1
-        row["beneficiary_total_received"] = current_amount
-        row["beneficiary_avg_received_amount"] = current_amount
-        row["beneficiary_unique_senders"] = 1 if sender_account else 0
-        row["beneficiary_unique_sender_nationalities_so_far"] = 1 if sender_nat != "Unknown" else 0
-        row["beneficiary_pep_sender_count_at_time_of_txn"] = is_pep
-        row["beneficiary_receive_count_so_far"] = 1
-        row["beneficiary_total_received_so_far"] = current_amount
-        row["beneficiary_unique_senders_at_time_of_txn"] = 1 if sender_account else 0
-        
-        print(f"[DEBUG] No history found. Using current transaction values:", file=sys.stderr)
-        print(f"[DEBUG]   beneficiary_receive_count = {row['beneficiary_receive_count']}", file=sys.stderr)
-        print(f"[DEBUG]   beneficiary_total_received = {row['beneficiary_total_received']}", file=sys.stderr)
-        print(f"[DEBUG]   beneficiary_unique_senders = {row['beneficiary_unique_senders']}", file=sys.stderr)
-        print(f"[DEBUG]   beneficiary_pep_sender_count_at_time_of_txn = {row['beneficiary_pep_sender_count_at_time_of_txn']}", file=sys.stderr)
-        return row
-    
+    log.debug("=== COMPUTING BENEFICIARY FEATURES === account: %s", beneficiary_account)
+
     try:
-        # Filter transactions where this account is the beneficiary/receiver
-        benef_col = "account_1"  # This is the correct column name in the database
-        benef_txns = historical_df[historical_df[benef_col] == beneficiary_account].copy()
-        
-        if not benef_txns.empty:
-            # 1) Beneficiary receive count
-            receive_count = len(benef_txns)
-            row["beneficiary_receive_count"] = receive_count
-            row["beneficiary_receive_count_so_far"] = receive_count
-            
-            # 2) Total amount received by beneficiary
-            amount_col = "amount_received" if "amount_received" in benef_txns.columns else "amount"
-            
-            if amount_col in benef_txns.columns:
-                total_received = pd.to_numeric(benef_txns[amount_col], errors='coerce').sum()
-                row["beneficiary_total_received"] = float(total_received) if pd.notna(total_received) else 0
-                row["beneficiary_total_received_so_far"] = float(total_received) if pd.notna(total_received) else 0
-                
-                # 3) Average amount received: total_amount_to_beneficiary / number of transactions
-                if receive_count > 0:
-                    row["beneficiary_avg_received_amount"] = float(total_received / receive_count) if pd.notna(total_received) else 0
-                else:
-                    row["beneficiary_avg_received_amount"] = 0
-            else:
-                row["beneficiary_total_received"] = 0
-                row["beneficiary_total_received_so_far"] = 0
-                row["beneficiary_avg_received_amount"] = 0
-            
-            # 4) Unique senders: number of unique bank accounts who send to beneficiary
-            sender_col = "account" if "account" in benef_txns.columns else "from_account"
-            
-            if sender_col in benef_txns.columns:
-                unique_senders = benef_txns[sender_col].nunique()
-                row["beneficiary_unique_senders"] = unique_senders
-                row["beneficiary_unique_senders_at_time_of_txn"] = unique_senders
-            else:
-                row["beneficiary_unique_senders"] = 0
-                row["beneficiary_unique_senders_at_time_of_txn"] = 0
-            
-            # 5) Unique sender nationalities: number of different nationalities of people who send to beneficiary
-            nat_col = "nationality"
-            if nat_col in benef_txns.columns:
-                # Filter out null/empty nationalities and count unique
-                unique_nationalities = benef_txns[nat_col].dropna().nunique()
-                row["beneficiary_unique_sender_nationalities_so_far"] = unique_nationalities
-            else:
-                row["beneficiary_unique_sender_nationalities_so_far"] = 0
-            
-            # 6) PEP senders count: the number of PEP people who send money to beneficiary
-            pep_col = "is_pep"
-            if pep_col in benef_txns.columns:
-                # Count rows where is_pep equals 1 or True
-                pep_senders = (pd.to_numeric(benef_txns[pep_col], errors='coerce') == 1).sum()
-                row["beneficiary_pep_sender_count_at_time_of_txn"] = int(pep_senders)
-            else:
-                row["beneficiary_pep_sender_count_at_time_of_txn"] = 0
-        else:
-            # No historical records found, use current transaction as baseline
-            current_amount = float(row.get("amount_received") or row.get("amount") or 0)
-            sender_account = row.get("account") or row.get("fromAccount") or ""
-            sender_nat = row.get("nationality") or "Unknown"
-            is_pep = int(row.get("is_pep") or 0)
-            
-            row["beneficiary_receive_count"] = 1
-            row["beneficiary_total_received"] = current_amount
-            row["beneficiary_avg_received_amount"] = current_amount
-            row["beneficiary_unique_senders"] = 1 if sender_account else 0
-            row["beneficiary_unique_sender_nationalities_so_far"] = 1 if sender_nat != "Unknown" else 0
-            row["beneficiary_pep_sender_count_at_time_of_txn"] = is_pep
-            row["beneficiary_receive_count_so_far"] = 1
-            row["beneficiary_total_received_so_far"] = current_amount
-            row["beneficiary_unique_senders_at_time_of_txn"] = 1 if sender_account else 0
+        features = get_feature_store().beneficiary_features(beneficiary_account) if beneficiary_account else None
+        if features is None:
+            # For new beneficiary with no history, calculate from current transaction
+            _first_beneficiary_features(row)
+            if debug_enabled():
+                log.debug("No history found. Using current transaction values: %s",
+                          _feature_summary(row, BENEFICIARY_DEBUG_FEATURES))
+            return row
+        row.update(features)
     except Exception as e:
-        print(f"[WARN] Error computing beneficiary features: {e}", file=sys.stderr)
+        log.warning("Error computing beneficiary features: %s", e)
         # On error, use current transaction as baseline
-        current_amount = float(row.get("amount_received") or row.get("amount") or 0)
-        sender_account = row.get("account") or row.get("fromAccount") or ""
-        sender_nat = row.get("nationality") or "Unknown"
-        is_pep = int(row.get("is_pep") or 0)
-        
-        row["beneficiary_receive_count"] = 1
-        row["beneficiary_total_received"] = current_amount
-        row["beneficiary_avg_received_amount"] = current_amount
-        row["beneficiary_unique_senders"] = 1 if sender_account else 0
-        row["beneficiary_unique_sender_nationalities_so_far"] = 1 if sender_nat != "Unknown" else 0
-        row["beneficiary_pep_sender_count_at_time_of_txn"] = is_pep
-        row["beneficiary_receive_count_so_far"] = 1
-        row["beneficiary_total_received_so_far"] = current_amount
-        row["beneficiary_unique_senders_at_time_of_txn"] = 1 if sender_account else 0
-    
-    print(f"[DEBUG] Beneficiary features computed successfully:", file=sys.stderr)
-    print(f"[DEBUG]   beneficiary_receive_count = {row.get('beneficiary_receive_count', 'NOT SET')}", file=sys.stderr)
-    print(f"[DEBUG]   beneficiary_total_received = {row.get('beneficiary_total_received', 'NOT SET')}", file=sys.stderr)
-    print(f"[DEBUG]   beneficiary_unique_senders = {row.get('beneficiary_unique_senders', 'NOT SET')}", file=sys.stderr)
-    print(f"[DEBUG]   beneficiary_pep_sender_count_at_time_of_txn = {row.get('beneficiary_pep_sender_count_at_time_of_txn', 'NOT SET')}", file=sys.stderr)
-    
+        _first_beneficiary_features(row)
+
+    if debug_enabled():
+        log.debug("Beneficiary features computed: %s", _feature_summary(row, BENEFICIARY_DEBUG_FEATURES))
+
+    return row
+
+# -----------------------
 # utility: compute engineered features
 # -----------------------
-def compute_engineered_features(row: dict) -> dict:
-    now = datetime.now()
+@functools.lru_cache(maxsize=4096)
+def _parse_date_cached(value):
+    return pd.to_datetime(value)
+
+def _parse_date(value):
+    """pd.to_datetime for one value; hashable values are parsed once and cached (batch scoring repeats dates a lot)."""
+    try:
+        return _parse_date_cached(value)
+    except TypeError:
+        # unhashable input
+        return pd.to_datetime(value)
+
+def compute_engineered_features(row: dict, now: datetime | None = None) -> dict:
+    now = now or datetime.now()
     
     # age
     if row.get("date_of_birth"):
         try:
-            dob = pd.to_datetime(row["date_of_birth"])
+            dob = _parse_date(row["date_of_birth"])
             row["age"] = int(now.year - dob.year - ((now.month, now.day) < (dob.month, dob.day)))
         except Exception:
             row["age"] = np.nan
@@ -615,7 +622,7 @@ def compute_engineered_features(row: dict) -> dict:
     # customer_tenure_month
     if row.get("customer_since"):
         try:
-            cs = pd.to_datetime(row["customer_since"])
+            cs = _parse_date(row["customer_since"])
             months = (now.year - cs.year) * 12 + (now.month - cs.month)
             row["customer_tenure_month"] = int(months)
         except Exception:
@@ -634,8 +641,13 @@ def compute_engineered_features(row: dict) -> dict:
     # Compute sender/beneficiary features
     # If USE_DB_FEATURES=true, enrich from DB; otherwise, expect raw values from user and fallback to safe defaults
     if USE_DB_FEATURES:
-        row = compute_sender_features(row, pd.DataFrame())
-        row = compute_beneficiary_features(row, pd.DataFrame())
+        # both history lookups in flight at once; the two calls below then hit the store
+        try:
+            get_feature_store().hydrate(*_history_accounts(row), now)
+        except Exception as e:
+            log.warning("Failed to load feature history: %s", e)
+        row = compute_sender_features(row, now=now)
+        row = compute_beneficiary_features(row)
     else:
         # Ensure presence of sender features
         row.setdefault("days_since_last_txn", 0)
@@ -666,140 +678,508 @@ def compute_engineered_features(row: dict) -> dict:
 # -----------------------
 # helper: save prediction to database
 # -----------------------
+# Columns of the transaction table are read once and cached for DB_SCHEMA_TTL seconds
+# (0 re-reads them for every insert); refresh_transaction_schema() drops the cache.
+DB_SCHEMA_TTL = float(os.environ.get("DB_SCHEMA_TTL", "300"))
+_TRANSACTION_COLUMNS = None
+_TRANSACTION_COLUMNS_AT = 0.0
+# (row keys, keys with None values) -> (INSERT statement, [(row key, conversion), ...])
+_INSERT_PLANS = {}
+_INSERT_PLANS_MAX = 256
+
+def refresh_transaction_schema():
+    """Forget the cached transaction columns and insert plans (e.g. after an ALTER TABLE)."""
+    global _TRANSACTION_COLUMNS, _TRANSACTION_COLUMNS_AT
+    _TRANSACTION_COLUMNS = None
+    _TRANSACTION_COLUMNS_AT = 0.0
+    _INSERT_PLANS.clear()
+
+def get_transaction_columns(cur) -> frozenset:
+    """Column names of the transaction table, cached for DB_SCHEMA_TTL seconds."""
+    global _TRANSACTION_COLUMNS, _TRANSACTION_COLUMNS_AT
+    if _TRANSACTION_COLUMNS is not None and time.monotonic() - _TRANSACTION_COLUMNS_AT < DB_SCHEMA_TTL:
+        return _TRANSACTION_COLUMNS
+    cur.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'transaction'", (os.environ.get('DB_NAME', ''),))
+    cols = frozenset(r['COLUMN_NAME'] for r in cur.fetchall())
+    if cols != _TRANSACTION_COLUMNS:
+        _INSERT_PLANS.clear()
+    _TRANSACTION_COLUMNS = cols
+    _TRANSACTION_COLUMNS_AT = time.monotonic()
+    return cols
+
+def _db_value(v, conversion):
+    if conversion == "value":
+        if isinstance(v, (dict, list)):
+            return json.dumps(v)
+        if isinstance(v, datetime):
+            return v.isoformat()
+        return v
+    if conversion == "json":
+        return json.dumps(v) if isinstance(v, (list, dict)) else v
+    return v
+
+def build_insert_plan(row_keys: tuple, none_keys: frozenset, colsSet: frozenset) -> tuple:
+    """
+    Resolve which row key goes into which column of the transaction table, following the
+    mapping rules of insert_prediction_into_db (COLUMN_RENAME_MAP, the prediction/outcome
+    columns, then find_col heuristics). Depends only on the row's keys (and order), which
+    of them are None and the table columns, so it is computed once per row shape.
+    Returns (sql, [(row key, conversion), ...]) or None when no column matches.
+    """
+    keys = set(row_keys)
+    plan = {}  # db column -> (row key, conversion), in insertion order
+
+    # 1) Use explicit COLUMN_RENAME_MAP when available
+    for model_key, db_col in COLUMN_RENAME_MAP.items():
+        if model_key in keys and db_col in colsSet:
+            plan[db_col] = (model_key, "value")
+
+    # 2) Map standard prediction/confidence/key_factors/saved_at if present
+    if 'prediction' in keys:
+        if 'is_laundering' in colsSet:
+            plan['is_laundering'] = ('prediction', "raw")
+        elif 'prediction' in colsSet:
+            plan['prediction'] = ('prediction', "raw")
+    if 'confidence' in keys and 'confidence' in colsSet:
+        plan['confidence'] = ('confidence', "raw")
+    if 'key_factors' in keys and 'key_factors' in colsSet:
+        plan['key_factors'] = ('key_factors', "json")
+    if 'saved_at' in keys:
+        # a transaction's own timestamp (when it has one) takes precedence over saved_at
+        for col in ('timestamp', 'saved_at', 'transaction_date'):
+            if col in colsSet and (col not in keys or col in none_keys or col == 'saved_at'):
+                plan[col] = ('saved_at', "raw")
+                break
+
+    # 3) Fallback: attempt to match remaining keys heuristically
+    def find_col(name):
+        candidates = [
+            name,
+            name.lower(),
+            name.replace(' ', '_'),
+            name.replace(' ', '_').lower(),
+            name.replace('.', '_').lower(),
+            name.replace(' ', ''),
+            name.replace(' ', '').lower(),
+        ]
+        for c in candidates:
+            if c in colsSet and c not in plan:
+                return c
+        return None
+
+    for k in row_keys:
+        # skip if already mapped (to a non-null value)
+        renamed = COLUMN_RENAME_MAP.get(k)
+        if renamed in colsSet and renamed in plan and plan[renamed][0] not in none_keys:
+            continue
+        col = find_col(k)
+        if not col:
+            continue
+        plan[col] = (k, "value")
+
+    if not plan:
+        return None
+    placeholders = ','.join(['%s'] * len(plan))
+    col_list = ','.join([f"`{c}`" for c in plan.keys()])
+    sql = f"INSERT INTO transaction ({col_list}) VALUES ({placeholders})"
+    if 'idempotency_key' in plan:
+        # unique idempotency_key: a retried transaction is not inserted twice
+        sql += " ON DUPLICATE KEY UPDATE `idempotency_key` = `idempotency_key`"
+    return sql, list(plan.values())
+
+def get_insert_plan(row: dict, colsSet: frozenset):
+    """Cached build_insert_plan() for the shape of `row`."""
+    shape = (tuple(row.keys()), frozenset(k for k, v in row.items() if v is None))
+    plan = _INSERT_PLANS.get(shape)
+    if plan is None and shape not in _INSERT_PLANS:
+        plan = build_insert_plan(shape[0], shape[1], colsSet)
+        if len(_INSERT_PLANS) >= _INSERT_PLANS_MAX:
+            _INSERT_PLANS.clear()
+        _INSERT_PLANS[shape] = plan
+    return plan
+
 def insert_prediction_into_db(row: dict):
     """Insert the given row into the transaction table with all features, mapping only existing columns."""
     try:
         import db_config
-        conn = db_config.get_connection()
-        try:
+        with db_config.pooled_connection() as conn:
             with conn.cursor() as cur:
-                # fetch available columns
-                cur.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'transaction'", (os.environ.get('DB_NAME', ''),))
-                cols = [r['COLUMN_NAME'] for r in cur.fetchall()]
-
-                to_insert = {}
-                colsSet = set(cols)
-
-                # 1) Use explicit COLUMN_RENAME_MAP when available
-                for model_key, db_col in COLUMN_RENAME_MAP.items():
-                    if model_key in row and db_col in colsSet:
-                        v = row[model_key]
-                        if isinstance(v, (dict, list)):
-                            to_insert[db_col] = json.dumps(v)
-                        elif isinstance(v, datetime):
-                            to_insert[db_col] = v.isoformat()
-                        else:
-                            to_insert[db_col] = v
-
-                # 2) Map standard prediction/confidence/key_factors/saved_at if present
-                if 'prediction' in row:
-                    if 'is_laundering' in colsSet:
-                        to_insert['is_laundering'] = row['prediction']
-                    elif 'prediction' in colsSet:
-                        to_insert['prediction'] = row['prediction']
-                if 'confidence' in row and 'confidence' in colsSet:
-                    to_insert['confidence'] = row['confidence']
-                if 'key_factors' in row and 'key_factors' in colsSet:
-                    to_insert['key_factors'] = json.dumps(row['key_factors']) if isinstance(row['key_factors'], (list, dict)) else row['key_factors']
-                if 'saved_at' in row:
-                    if 'timestamp' in colsSet:
-                        to_insert['timestamp'] = row['saved_at']
-                    elif 'saved_at' in colsSet:
-                        to_insert['saved_at'] = row['saved_at']
-                    elif 'transaction_date' in colsSet:
-                        to_insert['transaction_date'] = row['saved_at']
-
-                # 3) Fallback: attempt to match remaining keys heuristically
-                def find_col(name):
-                    candidates = [
-                        name,
-                        name.lower(),
-                        name.replace(' ', '_'),
-                        name.replace(' ', '_').lower(),
-                        name.replace('.', '_').lower(),
-                        name.replace(' ', ''),
-                        name.replace(' ', '').lower(),
-                    ]
-                    for c in candidates:
-                        if c in colsSet and c not in to_insert:
-                            return c
-                    return None
-
-                for k, v in row.items():
-                    # skip if already mapped
-                    already_mapped = any((colsSet).__contains__(c) and to_insert.get(c) is not None for c in [COLUMN_RENAME_MAP.get(k)])
-                    if already_mapped:
-                        continue
-                    col = find_col(k)
-                    if not col:
-                        continue
-                    if isinstance(v, (dict, list)):
-                        to_insert[col] = json.dumps(v)
-                    elif isinstance(v, datetime):
-                        to_insert[col] = v.isoformat()
-                    else:
-                        to_insert[col] = v
-
-                if not to_insert:
+                plan = get_insert_plan(row, get_transaction_columns(cur))
+                if plan is None:
                     return False
-
-                placeholders = ','.join(['%s'] * len(to_insert))
-                col_list = ','.join([f"`{c}`" for c in to_insert.keys()])
-                sql = f"INSERT INTO transaction ({col_list}) VALUES ({placeholders})"
-                cur.execute(sql, tuple(to_insert.values()))
+                sql, sources = plan
+                try:
+                    cur.execute(sql, tuple(_db_value(row[k], conversion) for k, conversion in sources))
+                except Exception:
+                    # the table may have changed since the columns were cached
+                    refresh_transaction_schema()
+                    raise
                 conn.commit()
                 return True
-        finally:
-            conn.close()
     except Exception as e:
-        print(f"[WARN] Failed to insert into DB: {e}", file=sys.stderr)
+        log.warning("Failed to insert into DB: %s", e)
         return False
 
+# -----------------------
+# write-behind buffer for prediction rows (serve / batch modes)
+# -----------------------
+DB_WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", "200"))
+DB_WRITE_FLUSH_SECONDS = float(os.environ.get("DB_WRITE_FLUSH_SECONDS", "1.0"))
+DB_WRITE_QUEUE_MAX = int(os.environ.get("DB_WRITE_QUEUE_MAX", "10000"))
+DB_SPILL_PATH = os.environ.get("DB_SPILL_PATH", os.path.join(os.path.dirname(__file__), "prediction_spill.jsonl"))
+
+def _spill_value(v):
+    """JSON-safe value for a spilled row (None for NaN/NA, plain Python scalars)."""
+    if isinstance(v, (dict, list)):
+        return v
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, datetime):
+        return v.isoformat()
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return v
+
+class PredictionWriter:
+    """
+    Collects rows for the transaction table and writes them from a background thread with
+    one multi-row INSERT (executemany) per row shape, once DB_WRITE_BATCH_SIZE rows are
+    queued or DB_WRITE_FLUSH_SECONDS have passed, so scoring does not wait for MySQL.
+    Rows of a batch that cannot be written are appended to DB_SPILL_PATH (JSONL) instead
+    of being dropped; `predict.py replay-spill` writes them back later.
+    on_done, if given, is called with every list of submitted rows the writer is done
+    with (written or spilled).
+    """
+
+    def __init__(self, batch_size=None, flush_seconds=None, max_queue=None, spill_path=None, on_done=None):
+        self.batch_size = max(1, batch_size or DB_WRITE_BATCH_SIZE)
+        self.flush_seconds = DB_WRITE_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.max_queue = max(self.batch_size, max_queue or DB_WRITE_QUEUE_MAX)
+        self.spill_path = spill_path or DB_SPILL_PATH
+        self.on_done = on_done
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closing = False
+        self.submitted = 0
+        self.written_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.spilled_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        # started last: _run reads the state above
+        self._thread = threading.Thread(target=self._run, name="prediction-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: dict) -> bool:
+        """Queue one row; blocks while the queue is full (spilling the row if that lasts too long)."""
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("prediction writer is closed")
+            deadline = time.monotonic() + max(10 * self.flush_seconds, 5.0)
+            while len(self._queue) >= self.max_queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            else:
+                self._queue.append(row)
+                self.submitted += 1
+                if len(self._queue) >= self.batch_size or self.flush_seconds <= 0:
+                    self._cond.notify_all()
+                return True
+        self._spill([row], "write queue full")
+        self._done([row])
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_seconds
+                while not (self._closing or self._flush_requested) and len(self._queue) < self.batch_size:
+                    if self.flush_seconds <= 0:
+                        # no flush interval: write whatever is queued, else sleep until a row arrives
+                        if self._queue:
+                            break
+                        self._cond.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._queue:
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    if self._closing:
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+                self._in_flight = len(batch)
+                self._cond.notify_all()
+            try:
+                self.write_rows(batch)
+            finally:
+                self._done(batch)
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _done(self, rows: list):
+        if self.on_done is not None:
+            try:
+                self.on_done(rows)
+            except Exception as e:
+                log.warning("Prediction writer callback failed: %s", e)
+
+    def write_rows(self, rows: list):
+        """
+        Write rows now (grouped by insert plan); rows that fail are spilled. Each row is
+        either written or spilled once: an error after some groups were stored (the pool
+        connections autocommit) only spills the rows not settled yet.
+        """
+        started = time.perf_counter()
+        failed = False
+        settled = set()  # id() of the rows written or spilled
+        try:
+            import db_config
+            with db_config.pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cols = get_transaction_columns(cur)
+                    groups = {}
+                    unplanned = []
+                    for row in rows:
+                        plan = get_insert_plan(row, cols)
+                        if plan is None:
+                            unplanned.append(row)
+                            continue
+                        sql, sources = plan
+                        groups.setdefault(sql, []).append(
+                            (row, tuple(_db_value(row[k], conversion) for k, conversion in sources))
+                        )
+                    for sql, items in groups.items():
+                        group = [row for row, _ in items]
+                        try:
+                            cur.executemany(sql, [values for _, values in items])
+                        except Exception as e:
+                            failed = True
+                            refresh_transaction_schema()
+                            self._spill(group, e)
+                            settled.update(map(id, group))
+                            continue
+                        # stored once executemany returns (autocommit); commit() is a no-op then
+                        settled.update(map(id, group))
+                        self.written_rows += len(group)
+                        conn.commit()
+                    if unplanned:
+                        failed = True
+                        self._spill(unplanned, "no transaction table column matches the row")
+                        settled.update(map(id, unplanned))
+        except Exception as e:
+            failed = True
+            rest = [row for row in rows if id(row) not in settled]
+            if rest:
+                self._spill(rest, e)
+            else:
+                log.warning("Prediction rows were written, but the DB connection failed afterwards: %s", e)
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.failed_flushes += failed
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def _spill(self, rows: list, error):
+        log.warning("Failed to write %d prediction row(s) to DB (%s); spilling to %s", len(rows), error, self.spill_path)
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as fh:
+                for row in rows:
+                    fh.write(json.dumps({k: _spill_value(v) for k, v in row.items()}) + "\n")
+                fh.flush()
+                os.fsync(fh.fileno())
+            self.spilled_rows += len(rows)
+        except Exception as e:
+            log.error("Failed to spill prediction rows: %s", e)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued row has been written (or spilled)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._queue or self._in_flight) and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = None):
+        """Flush and stop the background thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            leftover = list(self._queue)
+            self._queue.clear()
+        if leftover:
+            self.write_rows(leftover)
+            self._done(leftover)
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth, in_flight = len(self._queue), self._in_flight
+        return {
+            "queue_depth": depth,
+            "in_flight": in_flight,
+            "submitted": self.submitted,
+            "written_rows": self.written_rows,
+            "spilled_rows": self.spilled_rows,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+            "max_flush_seconds": round(self.max_flush_seconds, 6),
+            "avg_flush_seconds": round(self.total_flush_seconds / self.flushes, 6) if self.flushes else None,
+        }
+
+_PREDICTION_WRITER = None
+
+def start_prediction_writer() -> PredictionWriter | None:
+    """Route SAVE_TO_DB rows of this process through a PredictionWriter (no-op when SAVE_TO_DB=false)."""
+    global _PREDICTION_WRITER
+    if SAVE_TO_DB and _PREDICTION_WRITER is None:
+        _PREDICTION_WRITER = PredictionWriter(on_done=release_history)
+        atexit.register(close_prediction_writer)
+    return _PREDICTION_WRITER
+
+def flush_prediction_writer():
+    if _PREDICTION_WRITER is not None:
+        _PREDICTION_WRITER.flush()
+
+def close_prediction_writer():
+    global _PREDICTION_WRITER
+    writer, _PREDICTION_WRITER = _PREDICTION_WRITER, None
+    if writer is not None:
+        writer.close()
+        log.info("Prediction writer: %s", json.dumps(writer.stats()))
+
+def persist_row(row: dict) -> bool:
+    """Queue a row on the active PredictionWriter, or insert it right away (one-shot mode)."""
+    if _PREDICTION_WRITER is not None:
+        hold_history(row)
+        try:
+            return _PREDICTION_WRITER.submit(row)
+        except Exception:
+            release_history([row])
+            raise
+    return insert_prediction_into_db(row)
+
+def has_idempotency_index(cur) -> bool:
+    """Whether the transaction table has a unique index on idempotency_key alone (see README)."""
+    cur.execute("SHOW INDEX FROM `transaction`")
+    columns = {}
+    for r in cur.fetchall():
+        if not int(r.get("Non_unique", 1)):
+            columns.setdefault(r.get("Key_name"), []).append(r.get("Column_name"))
+    return ["idempotency_key"] in columns.values()
+
+def replay_spilled_predictions(path: str = None, allow_duplicates: bool = False) -> dict:
+    """
+    Write the rows of a spill file back to the DB; rows that fail again are re-spilled.
+    The rows being replayed are moved to <path>.replaying first; one left behind by a
+    crashed replay is replayed again, together with anything spilled since.
+    A replayed row may already be stored (a crash mid-replay, or a write that failed after
+    the insert), so the replay relies on the unique idempotency_key index to skip those:
+    without the index it refuses to run, unless allow_duplicates.
+    """
+    path = path or DB_SPILL_PATH
+    replaying = path + ".replaying"
+    if not (os.path.exists(path) or os.path.exists(replaying)):
+        return {"spill_file": path, "rows": 0}
+    if not allow_duplicates:
+        import db_config
+        with db_config.pooled_connection() as conn:
+            with conn.cursor() as cur:
+                indexed = has_idempotency_index(cur)
+        if not indexed:
+            return {"spill_file": path, "error": "the transaction table has no unique idempotency_key index, "
+                    "so replayed rows could be inserted twice; add it (see README) or pass --allow-duplicates"}
+    if os.path.exists(path):
+        if os.path.exists(replaying):
+            with open(path, encoding="utf-8") as src, open(replaying, "a", encoding="utf-8") as dst:
+                dst.write("\n" + src.read())
+            os.remove(path)
+        else:
+            os.replace(path, replaying)
+    with open(replaying, encoding="utf-8") as fh:
+        rows = [json.loads(line) for line in fh if line.strip()]
+    writer = PredictionWriter(spill_path=path)
+    for start in range(0, len(rows), writer.batch_size):
+        writer.write_rows(rows[start:start + writer.batch_size])
+    writer.close()
+    os.remove(replaying)
+    return {"spill_file": path, "rows": len(rows), "written": writer.written_rows, "spilled_again": writer.spilled_rows}
+
 # -----------------------
 # load model + encoder safely
 # -----------------------
-def load_ensemble_models():
+def _timed(timings: dict | None, name: str, load, *args):
+    """load(*args), recording its wall time in seconds under timings[name] when timings is given."""
+    started = time.perf_counter()
+    try:
+        return load(*args)
+    finally:
+        if timings is not None:
+            timings[name] = round(time.perf_counter() - started, 4)
+
+def _load_catboost_model(path):
+    # CatBoost models saved as .cbm must be loaded via the CatBoost API
+    from catboost import CatBoostClassifier
+    model = CatBoostClassifier()
+    model.load_model(path)
+    return model
+
+def load_ensemble_models(timings: dict | None = None):
     """
-    Load ensemble models: CatBoost, XGBoost, Random Forest, and Stacking meta-model.
-    Returns tuple: (cat_model, xgb_model, rf_model, stacked_model, encoder)
+    Load the base models from the loose files in models/: CatBoost, XGBoost, Random Forest.
+    Returns tuple: (cat_model, xgb_model, rf_model, stacked_model, encoder); stacked_model is
+    always None, since the decision rule only uses the base models.
+    With a timings dict, the load time of each model is recorded in it (--startup-profile).
     """
     cat_model = None
     xgb_model = None
     rf_model = None
-    stacked_model = None
     encoder = None
     
     # Load base models
     if os.path.exists(CAT_MODEL_PATH):
-        # CatBoost models saved as .cbm must be loaded via the CatBoost API
-        cat_model = CatBoostClassifier()
-        cat_model.load_model(CAT_MODEL_PATH)
+        cat_model = _timed(timings, "cat_model", _load_catboost_model, CAT_MODEL_PATH)
     else:
         raise FileNotFoundError(f"CatBoost model not found at {CAT_MODEL_PATH}")
     
     if os.path.exists(XGB_MODEL_PATH):
-        xgb_model = joblib.load(XGB_MODEL_PATH)
+        xgb_model = _timed(timings, "xgb_model", joblib.load, XGB_MODEL_PATH)
     else:
         raise FileNotFoundError(f"XGBoost model not found at {XGB_MODEL_PATH}")
     
     if os.path.exists(RF_MODEL_PATH):
-        rf_model = joblib.load(RF_MODEL_PATH)
+        rf_model = _timed(timings, "rf_model", joblib.load, RF_MODEL_PATH)
     else:
         raise FileNotFoundError(f"Random Forest model not found at {RF_MODEL_PATH}")
     
-    # Load stacking model
-    if os.path.exists(STACKED_MODEL_PATH):
-        stacked_model = joblib.load(STACKED_MODEL_PATH)
-    else:
-        raise FileNotFoundError(f"Stacking model not found at {STACKED_MODEL_PATH}")
-    
     # Load categorical encoders
     if os.path.exists(ENCODER_PATH):
-        encoder = joblib.load(ENCODER_PATH)
+        encoder = _timed(timings, "encoder", joblib.load, ENCODER_PATH)
     else:
         encoder = None
     
-    return cat_model, xgb_model, rf_model, stacked_model, encoder
+    return cat_model, xgb_model, rf_model, None, encoder
 
 # -----------------------
 # load stacking configuration (base order and threshold)
@@ -822,35 +1202,275 @@ def load_stacking_config():
         pass
     return base_model_order, float(decision_threshold)
 
+# -----------------------
+# categorical encoding: LabelEncoders compiled into dict lookups
+# -----------------------
+CURRENCY_COLUMNS = ('Receiving Currency', 'Payment Currency', 'receiving_currency', 'payment_currency')
+
+# Currency-specific normalization: map codes to full names present in classes
+CURRENCY_SYNONYMS = {
+    'usd': ['us dollar', 'u.s. dollar', 'united states dollar'],
+    'eur': ['euro'],
+    'inr': ['indian rupee', 'rupee'],
+    'gbp': ['british pound', 'pound', 'sterling'],
+}
+
+# Generic fallback: map common words to codes if codes exist in classes
+CURRENCY_CODE_MAP = {
+    'euro': 'EUR', 'usd': 'USD', 'us dollar': 'USD', 'inr': 'INR', 'rupee': 'INR', 'gbp': 'GBP', 'pound': 'GBP',
+}
+
+# Bounded per-column cache of resolved fallbacks for values not known at compile time
+ENCODER_CACHE_SIZE = int(os.environ.get("ENCODER_CACHE_SIZE", "1024"))
+
+# Which fallback resolved a value that is not an exact class
+FALLBACK_KINDS = ('case_insensitive', 'currency_synonym', 'currency_substring', 'code_map',
+                  'unknown_class', 'first_class', 'error')
+
+class CompiledLabelEncoder:
+    """
+    A fitted LabelEncoder compiled into dict lookups, with the same safe fallbacks
+    the per-value encoder used (never -1):
+    exact class -> case-insensitive class -> (currency columns) synonym / substring
+    match -> code word mapping -> 'Unknown' class -> first class.
+    Every fallback only depends on str(value).strip().lower(); the ones that can be
+    known up front (class names, currency synonyms and codes) are resolved at compile time,
+    others are memoized in a bounded LRU. Rows that miss the exact table are counted
+    per fallback kind (see stats()) so drift in the encoders shows up.
+    """
+
+    def __init__(self, le, col_name=None, cache_size=None):
+        try:
+            classes = list(le.classes_)
+        except Exception:
+            classes = []
+        self.col_name = col_name
+        self.is_currency = col_name in CURRENCY_COLUMNS
+        self.classes = classes
+        self.classes_lower = [str(c).strip().lower() for c in classes]
+        # LabelEncoder.transform([c]) is the position of c in classes_
+        self.exact = {}
+        for i, c in enumerate(classes):
+            self.exact.setdefault(c, i)
+        self.lower = {}
+        for i, cls_l in enumerate(self.classes_lower):
+            self.lower.setdefault(cls_l, i)
+        # Prefer 'Unknown' class if available, else the first class (0 when there are no classes)
+        if 'unknown' in self.lower:
+            self.default = (self.lower['unknown'], 'unknown_class')
+        else:
+            self.default = (0, 'first_class')
+
+        known = set(self.lower) | set(CURRENCY_CODE_MAP)
+        if self.is_currency:
+            for code, syns in CURRENCY_SYNONYMS.items():
+                known.add(code)
+                known.update(syns)
+        self.resolved = {key: self._resolve_lower(key) for key in known}
+        self.cache_size = ENCODER_CACHE_SIZE if cache_size is None else cache_size
+        self.cache = collections.OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.rows = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.fallbacks = collections.Counter()
+        self.unknown_values = collections.Counter()
+
+    def _resolve_lower(self, v_l):
+        """(code, fallback kind) for a normalized (stripped, lower-cased) value."""
+        if v_l in self.lower:
+            return self.lower[v_l], 'case_insensitive'
+        if self.is_currency:
+            # Search exact synonyms first: any class containing any synonym token
+            for code, syns in CURRENCY_SYNONYMS.items():
+                if v_l == code or v_l in syns:
+                    search_terms = [code] + syns
+                    for i, cls_l in enumerate(self.classes_lower):
+                        if any(term in cls_l for term in search_terms):
+                            return i, 'currency_synonym'
+            # Fallback: substring match of provided token within classes
+            for i, cls_l in enumerate(self.classes_lower):
+                if v_l in cls_l:
+                    return i, 'currency_substring'
+        mapped = CURRENCY_CODE_MAP.get(v_l)
+        if mapped is not None and mapped in self.exact:
+            return self.exact[mapped], 'code_map'
+        return self.default
+
+    def _lookup_fallback(self, v_l):
+        hit = self.resolved.get(v_l)
+        if hit is not None:
+            return hit
+        hit = self.cache.get(v_l)
+        if hit is not None:
+            self.cache.move_to_end(v_l)
+            self.cache_hits += 1
+            return hit
+        self.cache_misses += 1
+        hit = self._resolve_lower(v_l)
+        if self.cache_size > 0:
+            self.cache[v_l] = hit
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return hit
+
+    def _resolve_value(self, v):
+        """(code, fallback kind or None for an exact class) for one raw value."""
+        try:
+            code = self.exact.get(v)
+            if code is not None:
+                return code, None
+            if not self.classes:
+                return 0, 'first_class'
+            return self._lookup_fallback(str(v).strip().lower())
+        except Exception:
+            # As a last resort, return 0
+            return 0, 'error'
+
+    def _count(self, v, kind, n):
+        self.fallbacks[kind] += n
+        if kind in ('unknown_class', 'first_class', 'error'):
+            try:
+                key = str(v).strip()
+            except Exception:
+                key = '<unprintable>'
+            self.unknown_values[key] += n
+            # keep the sample of unseen values bounded
+            if len(self.unknown_values) > 2 * max(self.cache_size, 1):
+                for value, _ in self.unknown_values.most_common()[max(self.cache_size, 1):]:
+                    del self.unknown_values[value]
+
+    def encode_value(self, v):
+        """Encoded class index for one raw value."""
+        code, kind = self._resolve_value(v)
+        self.rows += 1
+        if kind is not None:
+            self._count(v, kind, 1)
+        return code
+
+    def encode(self, series: pd.Series) -> pd.Series:
+        """Encode a whole column: one lookup per distinct value, then a vectorized take."""
+        try:
+            idx, uniques = pd.factorize(series, use_na_sentinel=False)
+        except TypeError:
+            # unhashable values
+            return series.map(self.encode_value)
+        self.rows += len(idx)
+        lookup = np.empty(len(uniques), dtype=np.int64)
+        counts = None
+        for j, u in enumerate(uniques):
+            code, kind = self._resolve_value(u)
+            lookup[j] = code
+            if kind is not None:
+                if counts is None:
+                    counts = np.bincount(idx, minlength=len(uniques))
+                self._count(u, kind, int(counts[j]))
+        return pd.Series(lookup[idx], index=series.index, name=series.name)
+
+    def stats(self, top=10):
+        """Counters for this column since load (or the last reset_stats())."""
+        misses = sum(self.fallbacks.values())
+        return {
+            "rows": self.rows,
+            "fallback_rows": misses,
+            "unknown_rows": sum(self.fallbacks[k] for k in ('unknown_class', 'first_class', 'error')),
+            "fallbacks": {k: self.fallbacks[k] for k in FALLBACK_KINDS if self.fallbacks[k]},
+            "top_unknown_values": dict(self.unknown_values.most_common(top)),
+            "cache": {
+                "size": len(self.cache),
+                "max_size": self.cache_size,
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+            },
+        }
+
+def compile_encoders(encoder):
+    """
+    Compile a dict of LabelEncoders (categorical_encoders.pkl) into CompiledLabelEncoders.
+    Already-compiled dicts are returned as-is; non-dict encoders are returned unchanged.
+    """
+    if not isinstance(encoder, dict):
+        return encoder
+    if all(isinstance(le, CompiledLabelEncoder) for le in encoder.values()):
+        return encoder
+    return {
+        col: le if isinstance(le, CompiledLabelEncoder) else CompiledLabelEncoder(le, col)
+        for col, le in encoder.items()
+    }
+
+def encoder_stats(encoder, reset=False):
+    """Per-column fallback/unknown counters of compiled encoders ({} for other encoders)."""
+    if not isinstance(encoder, dict):
+        return {}
+    out = {}
+    for col, le in encoder.items():
+        if isinstance(le, CompiledLabelEncoder):
+            out[col] = le.stats()
+            if reset:
+                le.reset_stats()
+    return out
+
 # -----------------------
 # prepare final X for model
 # -----------------------
+# Alias columns matching the model's expected feature names
+# (the CatBoost model was trained with PascalCase feature names)
+MODEL_FEATURE_ALIASES = {
+    'receiving_currency': 'Receiving Currency',
+    'payment_currency': 'Payment Currency',
+    'payment_format': 'Payment Format',
+    'amount_binned': 'Amount_binned',
+    'amount_received_binned': 'Amount Received_binned',
+}
+
+@functools.lru_cache(maxsize=8)
+def model_input_columns(expected_order: tuple) -> tuple:
+    """
+    The engineered columns prepare_features_for_model() builds the model features in
+    expected_order from: the raw column of a binned feature, the snake_case source of an
+    aliased one, else the feature itself.
+    """
+    sources = {dst: src for src, dst in MODEL_FEATURE_ALIASES.items()}
+    columns = []
+    for feature in expected_order:
+        column = sources.get(feature, feature)
+        if column.endswith("_binned") and column[:-len("_binned")] in bins_config:
+            column = column[:-len("_binned")]
+        if column not in columns:
+            columns.append(column)
+    return tuple(columns)
+
+def missing_model_inputs(mapped: dict, expected_order=None) -> list:
+    """model_input_columns() absent from an engineered row: the model features it cannot provide."""
+    columns = model_input_columns(tuple(expected_order or categorical_features + numeric_features))
+    return [c for c in columns if c not in mapped]
+
 def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=None):
     """
     df_row: single-row DataFrame containing all raw + engineered features and also binned columns.
     encoder: categorical encoder (e.g., dict of LabelEncoders or ColumnTransformer)
     Returns: pandas DataFrame with encoded features ready for ensemble models
+    Multi-row frames are encoded the same way; the per-row diagnostics below are
+    only built for single-row calls with debug logging enabled.
     """
+    verbose = len(df_row) == 1 and debug_enabled()
+
     # Debug: Show log-transformed values for features that will be log-binned
-    try:
-        log_cols = [c for c in LOG_BIN_FEATURES if c in df_row.columns]
-        if log_cols:
-            df_logview = df_row.copy()
-            for c in log_cols:
-                df_logview[c] = np.log1p(pd.to_numeric(df_logview[c], errors='coerce').fillna(0))
-            _print_feature_block("FEATURES AFTER LOG TRANSFORMATION (BEFORE BINNING)", df_logview, log_cols)
-            # Also print raw vs log1p for quick comparison
-            for c in log_cols:
-                try:
+    if verbose:
+        try:
+            log_cols = [c for c in LOG_BIN_FEATURES if c in df_row.columns]
+            if log_cols:
+                lines = ["=== FEATURES AFTER LOG TRANSFORMATION (BEFORE BINNING) ==="]
+                for c in log_cols:
                     raw_val = pd.to_numeric(df_row[c], errors='coerce').fillna(0).values[0]
-                except Exception:
-                    raw_val = df_row[c].iloc[0] if hasattr(df_row[c], 'iloc') else df_row[c]
-                log_val = df_logview[c].iloc[0]
-                print(f"[DEBUG] {c}: raw={raw_val} log1p={log_val}", file=sys.stderr)
-        else:
-            print("[DEBUG] No log-bin features present in row", file=sys.stderr)
-    except Exception as e:
-        print(f"[ERROR] Failed to print log transformation debug: {e}", file=sys.stderr)
+                    lines.append(f"{c}: raw={raw_val} log1p={np.log1p(raw_val)}")
+                log.debug("\n".join(lines))
+            else:
+                log.debug("No log-bin features present in row")
+        except Exception as e:
+            log.error("Failed to print log transformation debug: %s", e)
 
     # IMPORTANT: Apply binning with selective log scale for features that require it.
     # For features listed in LOG_BIN_FEATURES, we bin log1p(values) using log1p(edges),
@@ -859,14 +1479,6 @@ def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=Non
     binned = apply_bins(df_row, bins_config, LOG_BIN_FEATURES)
 
     # 1.1) Create alias columns to match model's expected feature names
-    # The CatBoost model was trained with PascalCase feature names.
-    MODEL_FEATURE_ALIASES = {
-        'receiving_currency': 'Receiving Currency',
-        'payment_currency': 'Payment Currency',
-        'payment_format': 'Payment Format',
-        'amount_binned': 'Amount_binned',
-        'amount_received_binned': 'Amount Received_binned',
-    }
     for src, dst in MODEL_FEATURE_ALIASES.items():
         if src in binned.columns and dst not in binned.columns:
             binned[dst] = binned[src]
@@ -879,50 +1491,50 @@ def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=Non
     ):
         binned['beneficiary_unique_senders_binned'] = binned['beneficiary_unique_senders_at_time_of_txn_binned']
     
-    print(f"\n[DEBUG] Columns after binning: {list(binned.columns)}", file=sys.stderr)
-    print(f"[DEBUG] Log-binned features: {LOG_BIN_FEATURES}", file=sys.stderr)
-
     # Debug: show candidate vector right after binning (pre-encoding)
-    try:
+    if verbose:
+        log.debug("Columns after binning: %s", list(binned.columns))
+        log.debug("Log-binned features: %s", LOG_BIN_FEATURES)
         candidate_order_pre = [f for f in (categorical_features + numeric_features) if f in binned.columns]
-        _print_feature_block("FEATURES AFTER BINNING (CANDIDATE VECTOR)", binned, candidate_order_pre)
-    except Exception as e:
-        print(f"[ERROR] Failed to print features after binning: {e}", file=sys.stderr)
+        _log_feature_block("FEATURES AFTER BINNING (CANDIDATE VECTOR)", binned, candidate_order_pre)
 
     # Debug: per-feature bin diagnostics for key binned features
-    try:
-        for feat in bins_config.keys():
-            if feat in binned.columns and f"{feat}_binned" in binned.columns:
-                raw_val = pd.to_numeric(df_row[feat], errors="coerce").fillna(0).values[0]
-                log_val = None
-                if feat in LOG_BIN_FEATURES:
-                    log_val = float(np.log1p(raw_val))
-                bval = binned[f"{feat}_binned"].astype("Int64").values[0]
-                edges = prepare_bins(bins_config[feat])
-                # Edges interpretation: for log-binned features, edges are already in log space
-                # Determine the bracket
-                bracket_low = None
-                bracket_high = None
-                if pd.notna(bval):
-                    idx = int(bval)
-                    if idx >= 1 and idx < len(edges):
-                        bracket_low = edges[idx - 1]
-                        bracket_high = edges[idx]
-                print(
-                    f"[BIN] {feat}: raw={raw_val}"
-                    + (f" log1p={log_val}" if log_val is not None else "")
-                    + f" -> bin={bval} range=({bracket_low}, {bracket_high})",
-                    file=sys.stderr,
-                )
-    except Exception:
-        pass
+    if verbose:
+        try:
+            lines = []
+            for feat in bins_config.keys():
+                if feat in binned.columns and f"{feat}_binned" in binned.columns:
+                    raw_val = pd.to_numeric(df_row[feat], errors="coerce").fillna(0).values[0]
+                    log_val = None
+                    if feat in LOG_BIN_FEATURES:
+                        log_val = float(np.log1p(raw_val))
+                    bval = binned[f"{feat}_binned"].astype("Int64").values[0]
+                    edges = prepare_bins(bins_config[feat])
+                    # Edges interpretation: for log-binned features, edges are already in log space
+                    # Determine the bracket
+                    bracket_low = None
+                    bracket_high = None
+                    if pd.notna(bval):
+                        idx = int(bval)
+                        if idx >= 1 and idx < len(edges):
+                            bracket_low = edges[idx - 1]
+                            bracket_high = edges[idx]
+                    lines.append(
+                        f"[BIN] {feat}: raw={raw_val}"
+                        + (f" log1p={log_val}" if log_val is not None else "")
+                        + f" -> bin={bval} range=({bracket_low}, {bracket_high})"
+                    )
+            log.debug("\n".join(lines))
+        except Exception:
+            pass
 
     # 2) select categorical and numeric features as per your list
     cat_feats = [f for f in categorical_features if f in binned.columns]
     num_feats = [f for f in numeric_features if f in binned.columns]
     
-    print(f"[DEBUG] Categorical features found: {cat_feats}", file=sys.stderr)
-    print(f"[DEBUG] Numeric features found: {num_feats}", file=sys.stderr)
+    if verbose:
+        log.debug("Categorical features found: %s", cat_feats)
+        log.debug("Numeric features found: %s", num_feats)
 
     # 3) Encode categorical features using the loaded encoder
     if encoder is not None and len(cat_feats) > 0:
@@ -939,65 +1551,11 @@ def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=Non
 
             # If encoder is a dict of LabelEncoders (one per categorical column)
             if isinstance(encoder, dict):
-                # Helper to safely encode values, avoiding -1 by mapping unknowns to a known class
-                def safe_encode(le, v, col_name=None):
-                    try:
-                        if v in le.classes_:
-                            return le.transform([v])[0]
-                        # Case-insensitive match
-                        v_str = str(v).strip()
-                        v_l = v_str.lower()
-                        classes_list = list(getattr(le, 'classes_', []))
-                        classes_lower = [str(c).strip().lower() for c in classes_list]
-                        # Exact case-insensitive match
-                        for idx, cls_l in enumerate(classes_lower):
-                            if cls_l == v_l:
-                                return le.transform([classes_list[idx]])[0]
-                        # Currency-specific normalization: try mapping codes to full names present in classes
-                        currency_synonyms = {
-                            'usd': ['us dollar', 'u.s. dollar', 'united states dollar'],
-                            'eur': ['euro'],
-                            'inr': ['indian rupee', 'rupee'],
-                            'gbp': ['british pound', 'pound', 'sterling'],
-                        }
-                        # If column is a currency field, expand search
-                        if col_name in ('Receiving Currency', 'Payment Currency', 'receiving_currency', 'payment_currency'):
-                            key = v_l
-                            # Accept 3-letter codes by lower
-                            if len(v_str) == 3 and v_str.isalpha():
-                                key = v_l
-                            # Search exact synonyms first
-                            for code, syns in currency_synonyms.items():
-                                if v_l == code or v_l in syns:
-                                    # find any class containing any synonym token
-                                    search_terms = [code] + syns
-                                    for i, cls_l in enumerate(classes_lower):
-                                        if any(term in cls_l for term in search_terms):
-                                            return le.transform([classes_list[i]])[0]
-                            # Fallback: substring match of provided token within classes
-                            for i, cls_l in enumerate(classes_lower):
-                                if v_l in cls_l:
-                                    return le.transform([classes_list[i]])[0]
-                        # Generic fallback: map common words to codes if codes exist in classes
-                        mapping = {
-                            'euro': 'EUR', 'usd': 'USD', 'us dollar': 'USD', 'inr': 'INR', 'rupee': 'INR', 'gbp': 'GBP', 'pound': 'GBP',
-                        }
-                        if v_l in mapping and mapping[v_l] in classes_list:
-                            return le.transform([mapping[v_l]])[0]
-                        # Prefer 'Unknown' class if available
-                        for i, cls_l in enumerate(classes_lower):
-                            if cls_l == 'unknown':
-                                return le.transform([classes_list[i]])[0]
-                        # Fallback to first class to avoid -1
-                        return le.transform([classes_list[0]])[0]
-                    except Exception:
-                        # As a last resort, return 0
-                        return 0
-
+                # Compiled dict lookups with safe fallbacks (no -1); compiled once at load time
+                encoders = compile_encoders(encoder)
                 for col in string_cat_feats:
-                    if col in encoder and col in binned.columns:
-                        le = encoder[col]
-                        binned[col] = binned[col].map(lambda x: safe_encode(le, x, col))
+                    if col in encoders and col in binned.columns:
+                        binned[col] = encoders[col].encode(binned[col])
                 # For binned categorical features, ensure they are numeric codes (no encoding)
                 for col in binned_cat_feats:
                     binned[col] = pd.to_numeric(binned[col], errors='coerce').fillna(1)
@@ -1051,11 +1609,9 @@ def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=Non
                 binned[col] = binned[col].fillna(1)
 
     # Debug: print features after categorical encoding (candidate vector)
-    try:
+    if verbose:
         candidate_order = [f for f in (categorical_features + numeric_features) if f in binned.columns]
-        _print_feature_block("FEATURES AFTER CATEGORICAL ENCODING (CANDIDATE VECTOR)", binned, candidate_order)
-    except Exception as e:
-        print(f"[ERROR] Failed to print features after encoding: {e}", file=sys.stderr)
+        _log_feature_block("FEATURES AFTER CATEGORICAL ENCODING (CANDIDATE VECTOR)", binned, candidate_order)
 
     # Ensure specific known numeric flags are numeric
     for hard_num in ["kyc_score", "is_pep"]:
@@ -1071,78 +1627,224 @@ def prepare_features_for_model(df_row: pd.DataFrame, encoder, expected_order=Non
     final_feats = [f for f in expected_order if f in binned.columns]
     X_final = binned[final_feats]
     
-    print(f"\n[DEBUG] Final feature order for model: {final_feats}", file=sys.stderr)
-    print(f"[DEBUG] Feature count: {len(final_feats)} features", file=sys.stderr)
+    if verbose:
+        log.debug("Final feature order for model: %s", final_feats)
+        log.debug("Feature count: %d features", len(final_feats))
 
     # Print any missing features compared to expected_order
     missing = [f for f in expected_order if f not in binned.columns]
     if missing:
-        print(f"[WARN] Missing features (not present after engineering/binning): {missing}", file=sys.stderr)
+        log.warning("Missing features (not present after engineering/binning): %s", missing)
 
     return X_final
 
 
-def ensemble_predict(X, cat_model, xgb_model, rf_model, stacked_model, base_order=None, decision_threshold: float = 0.5):
+def _positive_proba(model, X, threads: int | None = None):
     """
-    Perform ensemble prediction using base models with simple threshold rule.
-    X: prepared features (DataFrame or numpy array)
-    Returns: (prediction, confidence, base_predictions)
-    
+    Positive-class probability per row (falls back to predict() for models without predict_proba).
+    threads: CatBoost prediction threads (the other libraries take theirs from their parameters).
+    """
+    if hasattr(model, "predict_proba"):
+        if threads and type(model).__module__.startswith("catboost"):
+            proba = model.predict_proba(X, thread_count=threads)
+        else:
+            proba = model.predict_proba(X)
+        return proba[:, 1] if proba.shape[1] > 1 else proba[:, 0]
+    return np.asarray(model.predict(X))
+
+
+# -----------------------
+# cascade mode: base models in order of measured cost, stopping at the first one above
+# the threshold (the decision is "any model > ANY_MODEL_THRESHOLD")
+# -----------------------
+ANY_MODEL_THRESHOLD = 0.3
+# opt-in: a flagged transaction's confidence is then a lower bound of the max score
+ENSEMBLE_CASCADE = os.environ.get("ENSEMBLE_CASCADE", "false").strip().lower() == "true"
+# weight of the newest timing in a model's cost estimate (EWMA)
+CASCADE_COST_ALPHA = float(os.environ.get("CASCADE_COST_ALPHA", "0.2"))
+# order used until every model has been timed (always, for one-shot calls); the default is
+# cheapest first for single rows with the library engines
+CASCADE_ORDER = tuple(m.strip().lower() for m in os.environ.get("CASCADE_ORDER", "cat,xgb,rf").split(",") if m.strip())
+
+class ModelCostTracker:
+    """
+    EWMA of each base model's seconds per row, kept apart for single rows and batches
+    (per-call overhead dominates single rows), and how many rows each cascade stage decided.
+    Until every model has been timed in a regime, initial_order is used.
+    """
+
+    def __init__(self, alpha: float = 0.2, initial_order=()):
+        self.alpha = alpha
+        self.initial_order = tuple(initial_order)
+        self._lock = threading.Lock()
+        self._cost = {}
+        self.evaluated_rows = collections.Counter()
+        self.decided_at = collections.Counter()
+        self.rows = 0
+
+    def record(self, name: str, seconds: float, rows: int):
+        if rows <= 0:
+            return
+        key = (name, rows == 1)
+        per_row = seconds / rows
+        with self._lock:
+            old = self._cost.get(key)
+            self._cost[key] = per_row if old is None else old + self.alpha * (per_row - old)
+            self.evaluated_rows[name] += rows
+
+    def order(self, names, single: bool) -> list:
+        """names cheapest first; in initial_order (then as given) while some model has no timing yet."""
+        with self._lock:
+            costs = [self._cost.get((name, single)) for name in names]
+        if any(c is None for c in costs):
+            return sorted(names, key=lambda n: self.initial_order.index(n) if n in self.initial_order else len(self.initial_order))
+        return [name for _, name in sorted(zip(costs, names))]
+
+    def record_decisions(self, stage_counts: dict, rows: int):
+        with self._lock:
+            self.decided_at.update(stage_counts)
+            self.rows += rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cost_ms_per_row": {
+                    f"{name}/{'single' if single else 'batch'}": round(cost * 1000, 4)
+                    for (name, single), cost in sorted(self._cost.items())
+                },
+                "rows": self.rows,
+                "evaluated_rows": dict(self.evaluated_rows),
+                # rows flagged by the model at that position (cheapest first); not_flagged rows needed all
+                "decided_at": dict(self.decided_at),
+            }
+
+MODEL_COSTS = ModelCostTracker(CASCADE_COST_ALPHA, CASCADE_ORDER)
+
+def _take_rows(X, rows):
+    return X.iloc[rows] if hasattr(X, "iloc") else X[rows]
+
+def cascade_scores(X, models: dict, threshold: float = ANY_MODEL_THRESHOLD) -> dict:
+    """
+    Positive-class scores of the models ({"cat": model, ...}) for every row of X, evaluated
+    cheapest first (MODEL_COSTS) on the rows no earlier model put above threshold. Rows a
+    model was not evaluated on are NaN.
+    """
+    n = len(X)
+    scores = {name: np.full(n, np.nan) for name in models}
+    remaining = np.arange(n)
+    stage_counts = collections.Counter()
+    for stage, name in enumerate(MODEL_COSTS.order(list(models), n == 1)):
+        if not len(remaining):
+            break
+        X_stage = X if len(remaining) == n else _take_rows(X, remaining)
+        started = time.perf_counter()
+        pred = np.atleast_1d(np.asarray(_positive_proba(models[name], X_stage, MODEL_THREADS.get(name)), dtype=float))
+        MODEL_COSTS.record(name, time.perf_counter() - started, len(remaining))
+        scores[name][remaining] = pred
+        flagged = pred > threshold
+        stage_counts[f"{stage + 1}:{name}"] += int(flagged.sum())
+        remaining = remaining[~flagged]
+    stage_counts["not_flagged"] += len(remaining)
+    MODEL_COSTS.record_decisions(stage_counts, n)
+    return scores
+
+# -----------------------
+# concurrent mode: the base models evaluated at the same time on a reusable thread pool
+# (CatBoost, XGBoost and sklearn's tree traversal release the GIL while predicting)
+# -----------------------
+ENSEMBLE_CONCURRENT = os.environ.get("ENSEMBLE_CONCURRENT", "false").strip().lower() == "true"
+
+# prediction threads per base model ({"cat": n, ...}), set by apply_model_threads; a model
+# that is not listed uses its library default
+MODEL_THREADS = {}
+
+_BASE_MODEL_EXECUTOR = None
+_BASE_MODEL_EXECUTOR_PID = None
+_BASE_MODEL_LOCK = threading.Lock()
+
+def base_model_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Threads evaluating the base models; a forked child (whose copy has no threads) starts its own."""
+    global _BASE_MODEL_EXECUTOR, _BASE_MODEL_EXECUTOR_PID
+    with _BASE_MODEL_LOCK:
+        if _BASE_MODEL_EXECUTOR is None or _BASE_MODEL_EXECUTOR_PID != os.getpid():
+            _BASE_MODEL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="base-model")
+            _BASE_MODEL_EXECUTOR_PID = os.getpid()
+        return _BASE_MODEL_EXECUTOR
+
+def apply_model_threads(ctx: dict, threads: dict) -> dict:
+    """
+    Limit the prediction threads of the base models ({"cat": n, "xgb": n, "rf": n}): XGBoost
+    and the Random Forest through their n_jobs parameter, CatBoost per predict call.
+    Records them in MODEL_THREADS and ctx["model_threads"].
+    """
+    for name, n in threads.items():
+        MODEL_THREADS[name] = n
+        # a TreeEngineModel keeps the library model for large batches
+        model = getattr(ctx[f"{name}_model"], "native", ctx[f"{name}_model"])
+        if name in ("xgb", "rf") and hasattr(model, "set_params"):
+            model.set_params(n_jobs=n)
+    ctx["model_threads"] = dict(MODEL_THREADS)
+    return ctx
+
+def concurrent_scores(X, models: dict) -> dict:
+    """
+    Positive-class scores of the models ({"cat": model, ...}) for every row of X: the first
+    one in the calling thread, the others at the same time on base_model_executor().
+    """
+    names = list(models)
+    pool = base_model_executor()
+    futures = {name: pool.submit(_positive_proba, models[name], X, MODEL_THREADS.get(name)) for name in names[1:]}
+    scores = {names[0]: _positive_proba(models[names[0]], X, MODEL_THREADS.get(names[0]))}
+    for name, future in futures.items():
+        scores[name] = future.result()
+    return {name: np.atleast_1d(np.asarray(scores[name], dtype=float)) for name in names}
+
+def ensemble_predict_batch(X, cat_model, xgb_model, rf_model, stacked_model, base_order=None, decision_threshold: float = 0.5,
+                           cascade: bool = None, parallel: bool = None):
+    """
+    Perform ensemble prediction for every row of X using base models with simple threshold rule.
+    X: prepared features (DataFrame or numpy array), one row per transaction
+    Returns: (predictions, confidences, base_predictions) as numpy arrays;
+    base_predictions has one column per model in base_order.
+
     Rule: If ANY base model gives probability > 0.3, flag as suspicious (return 1)
+
+    With cascade (default ENSEMBLE_CASCADE) the models run cheapest first and a row stops at
+    the first model above the threshold: its base_predictions are NaN for the models not
+    evaluated and its confidence is a lower bound of the max score. Unflagged rows always
+    get all three scores, so predictions are the same as without cascade.
+    With parallel (default ENSEMBLE_CONCURRENT) and no cascade the three models run at the
+    same time (concurrent_scores); the scores and their combination are unchanged.
     """
-    # Get predictions from base models
+    verbose = len(X) == 1 and debug_enabled()
+    cascade = ENSEMBLE_CASCADE if cascade is None else cascade
+    parallel = ENSEMBLE_CONCURRENT if parallel is None else parallel
     try:
-        # CatBoost prediction
-        if hasattr(cat_model, "predict_proba"):
-            cat_proba = cat_model.predict_proba(X)
-            cat_pred = cat_proba[:, 1] if cat_proba.shape[1] > 1 else cat_proba[:, 0]
-        else:
-            cat_pred = cat_model.predict(X)
-        try:
-            cat_val = float(cat_pred[0]) if hasattr(cat_pred, "__len__") else float(cat_pred)
-            print(f"[BASE] CatBoost score: {cat_val}", file=sys.stderr)
-        except Exception:
-            pass
-        
-        # XGBoost prediction
-        if hasattr(xgb_model, "predict_proba"):
-            xgb_proba = xgb_model.predict_proba(X)
-            xgb_pred = xgb_proba[:, 1] if xgb_proba.shape[1] > 1 else xgb_proba[:, 0]
-        else:
-            xgb_pred = xgb_model.predict(X)
-        try:
-            xgb_val = float(xgb_pred[0]) if hasattr(xgb_pred, "__len__") else float(xgb_pred)
-            print(f"[BASE] XGBoost score: {xgb_val}", file=sys.stderr)
-        except Exception:
-            pass
-        
-        # Random Forest prediction
-        if hasattr(rf_model, "predict_proba"):
-            rf_proba = rf_model.predict_proba(X)
-            rf_pred = rf_proba[:, 1] if rf_proba.shape[1] > 1 else rf_proba[:, 0]
+        # CatBoost, XGBoost and Random Forest predictions
+        models = {"cat": cat_model, "xgb": xgb_model, "rf": rf_model}
+        if cascade or parallel:
+            scores = cascade_scores(X, models) if cascade else concurrent_scores(X, models)
+            cat_pred, xgb_pred, rf_pred = scores["cat"], scores["xgb"], scores["rf"]
         else:
-            rf_pred = rf_model.predict(X)
-        try:
-            rf_val = float(rf_pred[0]) if hasattr(rf_pred, "__len__") else float(rf_pred)
-            print(f"[BASE] RandomForest score: {rf_val}", file=sys.stderr)
-        except Exception:
-            pass
-        
-        # Extract individual scores
-        cat_score = float(cat_pred[0]) if hasattr(cat_pred, "__len__") else float(cat_pred)
-        xgb_score = float(xgb_pred[0]) if hasattr(xgb_pred, "__len__") else float(xgb_pred)
-        rf_score = float(rf_pred[0]) if hasattr(rf_pred, "__len__") else float(rf_pred)
-        
-        print(f"[DEBUG] Base model predictions: CatBoost={cat_score:.4f}, XGBoost={xgb_score:.4f}, RandomForest={rf_score:.4f}", file=sys.stderr)
-        
+            cat_pred = np.atleast_1d(np.asarray(_positive_proba(cat_model, X, MODEL_THREADS.get("cat")), dtype=float))
+            xgb_pred = np.atleast_1d(np.asarray(_positive_proba(xgb_model, X, MODEL_THREADS.get("xgb")), dtype=float))
+            rf_pred = np.atleast_1d(np.asarray(_positive_proba(rf_model, X, MODEL_THREADS.get("rf")), dtype=float))
+        if verbose:
+            log.debug("[BASE] CatBoost score: %s", float(cat_pred[0]))
+            log.debug("[BASE] XGBoost score: %s", float(xgb_pred[0]))
+            log.debug("[BASE] RandomForest score: %s", float(rf_pred[0]))
+
         # Simple threshold rule: If ANY model > 0.3, flag as suspicious
-        THRESHOLD = 0.3
-        max_score = max(cat_score, xgb_score, rf_score)
-        final_pred = 1 if max_score > THRESHOLD else 0
-        confidence = max_score
-        
-        print(f"[DECISION] Max score: {max_score:.4f}, Threshold: {THRESHOLD}, Prediction: {final_pred}", file=sys.stderr)
-        
+        THRESHOLD = ANY_MODEL_THRESHOLD
+        # fmax: in cascade mode the models skipped for a row are NaN
+        combine = np.fmax if cascade else np.maximum
+        max_scores = combine(combine(cat_pred, xgb_pred), rf_pred)
+        final_preds = (max_scores > THRESHOLD).astype(int)
+        confidences = max_scores
+
+        if verbose:
+            log.debug("[DECISION] Max score: %.4f, Threshold: %s, Prediction: %s", max_scores[0], THRESHOLD, final_preds[0])
+
         # Stack base predictions for return value (for compatibility)
         base_map = {"cat": cat_pred, "xgb": xgb_pred, "rf": rf_pred}
         order = base_order or ["xgb", "rf", "cat"]
@@ -1152,44 +1854,117 @@ def ensemble_predict(X, cat_model, xgb_model, rf_model, stacked_model, base_orde
                 raise RuntimeError(f"Unknown base model in stacking order: {name}")
             base_stack.append(base_map[name])
         base_predictions = np.column_stack(base_stack)
-        
-        return final_pred, confidence, base_predictions[0]
-    
+
+        return final_preds, confidences, base_predictions
+
     except Exception as e:
         raise RuntimeError(f"Ensemble prediction failed: {e}")
 
+
+def ensemble_predict(X, cat_model, xgb_model, rf_model, stacked_model, base_order=None, decision_threshold: float = 0.5):
+    """
+    Single-transaction wrapper around ensemble_predict_batch.
+    Returns: (prediction, confidence, base_predictions) for the first row of X.
+    """
+    preds, confidences, base_predictions = ensemble_predict_batch(
+        X, cat_model, xgb_model, rf_model, stacked_model, base_order, decision_threshold
+    )
+    return int(preds[0]), float(confidences[0]), base_predictions[0]
+
+def cascade_report(base_scores, base_order) -> dict:
+    """Cascade-mode output fields of one row: the base models evaluated, and whether its confidence is only a lower bound."""
+    evaluated = [name for name, score in zip(base_order, base_scores) if not np.isnan(score)]
+    return {"evaluated_models": evaluated, "confidence_is_lower_bound": len(evaluated) < len(base_order)}
+
 # -----------------------
-# top-level: read stdin JSON, process, predict, print output
+# thread budget: prediction threads of CatBoost, XGBoost, the Random Forest and BLAS/OpenMP
+# in each scoring process, so that N processes x M threads never oversubscribe the cores
 # -----------------------
-def main():
-    print("=== PREDICT.PY VERSION: 2024-12-16-FIX ===", file=sys.stderr)
-    print(f"Python executable: {sys.executable}", file=sys.stderr)
-    print(f"Working directory: {os.getcwd()}", file=sys.stderr)
-    
-    raw = sys.stdin.read()
-    if not raw:
-        print(json.dumps({"error": "no input received"}))
-        return
+# auto: the cores split between the scoring processes, and in concurrent mode between the
+# three models as well; library: every library keeps its own default; N: N threads each.
+# Per-library overrides follow after commas, e.g. "auto,cat=2,blas=1" (cat, xgb, rf, blas).
+THREAD_BUDGET = os.environ.get("THREAD_BUDGET", "auto").strip().lower()
+THREAD_BUDGET_LIBRARIES = ("cat", "xgb", "rf", "blas")
 
-    try:
-        input_json = json.loads(raw)
-    except Exception as e:
-        print(json.dumps({"error": f"invalid json input: {e}"}))
-        return
+def resolve_thread_budget(workers=None, spec=None, cores: int = None) -> dict:
+    """
+    Threads per library for one of `workers` scoring processes (default resolve_worker_count()),
+    from spec (default THREAD_BUDGET): {"mode": ..., "workers": n, "cat": n, "xgb": n, "rf": n,
+    "blas": n}, where None leaves that library at its default.
+    """
+    spec = THREAD_BUDGET if spec is None else str(spec).strip().lower()
+    mode, *overrides = [part.strip() for part in spec.split(",") if part.strip()] or ["auto"]
+    workers = resolve_worker_count(workers)
+    if mode == "library":
+        budget = dict.fromkeys(THREAD_BUDGET_LIBRARIES)
+    elif mode == "auto":
+        share = max(1, (cores or os.cpu_count() or 1) // workers)
+        per_model = max(1, share // 3) if ENSEMBLE_CONCURRENT else share
+        budget = {"cat": per_model, "xgb": per_model, "rf": per_model, "blas": share}
+    elif mode.isdigit():
+        budget = dict.fromkeys(THREAD_BUDGET_LIBRARIES, max(1, int(mode)))
+    else:
+        raise ValueError(f"invalid THREAD_BUDGET mode: {mode!r} (auto, library or a thread count)")
+    for item in overrides:
+        name, _, n = item.partition("=")
+        if name not in THREAD_BUDGET_LIBRARIES or not (n.isdigit() or n == "library"):
+            raise ValueError(f"invalid THREAD_BUDGET entry: {item!r} (expected cat|xgb|rf|blas=N)")
+        budget[name] = None if n == "library" else max(1, int(n))
+    return {"mode": mode, "workers": workers, **budget}
+
+def _limit_blas_threads(threads: int) -> bool:
+    """Limit the BLAS and OpenMP pools of this process (threadpoolctl, when installed)."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        log.warning("threadpoolctl is not installed; BLAS/OpenMP threads are not limited")
+        return False
+    # not used as a context manager: the limit stays for the life of the process (and its forks)
+    threadpool_limits(limits=threads)
+    return True
 
-    # 1) Normalize legacy PascalCase keys and trim string values
-    LEGACY_KEY_MAP = {
-        "From Bank": "from_bank",
-        "Account": "account",
-        "To Bank": "to_bank_txn",
-        "Account.1": "account_1",
-        "Amount Received": "amount_received",
-        "Receiving Currency": "receiving_currency",
-        "Amount": "amount",
-        "Payment Currency": "payment_currency",
-        "Payment Format": "payment_format",
-    }
+def apply_thread_budget(ctx: dict, budget: dict) -> dict:
+    """
+    Set the prediction threads of this process from a resolve_thread_budget() budget: the
+    base models through apply_model_threads, BLAS/OpenMP through threadpoolctl.
+    In auto mode the Random Forest is never given more threads than its own n_jobs: on the
+    small batches scored here, joblib's dispatch over the trees costs more than it saves.
+    Records the threads in effect in ctx["thread_budget"].
+    """
+    threads = {name: budget[name] for name in ("cat", "xgb", "rf") if budget.get(name) is not None}
+    if budget.get("mode") == "auto" and "rf" in threads:
+        rf = getattr(ctx["rf_model"], "native", ctx["rf_model"])
+        own = getattr(rf, "n_jobs", None) or 1
+        threads["rf"] = min(threads["rf"], own if own > 0 else os.cpu_count() or 1)
+    apply_model_threads(ctx, threads)
+    blas = budget.get("blas")
+    if blas is not None and not _limit_blas_threads(blas):
+        blas = None
+    ctx["thread_budget"] = {"mode": budget.get("mode"), "workers": budget.get("workers"), **threads, "blas": blas}
+    return ctx
+
+# -----------------------
+# input normalization: legacy keys + UI keys -> model/db column names
+# -----------------------
+# Legacy PascalCase keys (as found in the raw transaction CSV exports)
+LEGACY_KEY_MAP = {
+    "From Bank": "from_bank",
+    "Account": "account",
+    "To Bank": "to_bank_txn",
+    "Account.1": "account_1",
+    "Amount Received": "amount_received",
+    "Receiving Currency": "receiving_currency",
+    "Amount": "amount",
+    "Payment Currency": "payment_currency",
+    "Payment Format": "payment_format",
+}
 
+def normalize_input(input_json: dict) -> dict:
+    """
+    Normalize one raw input transaction into model/db column names:
+    legacy keys, FEATURE_MAP UI keys, trimmed identifiers, is_pep flag and currency codes.
+    """
+    # 1) Normalize legacy PascalCase keys and trim string values
     normalized_input = {}
     for k, v in input_json.items():
         target_key = LEGACY_KEY_MAP.get(k, k)
@@ -1233,16 +2008,291 @@ def main():
             else:
                 mapped[cur_key] = s
 
+    return mapped
+
+# -----------------------
+# scoring context: everything loaded once and reused across transactions
+# -----------------------
+def resolve_expected_order(cat_model, xgb_model):
+    """Feature order the models were trained with: CatBoost, else XGBoost, else configured lists."""
+    # Determine expected orders from CatBoost and XGBoost if available
+    expected_cat = None
+    expected_xgb = None
+    if hasattr(cat_model, 'feature_names_') and cat_model.feature_names_:
+        expected_cat = list(cat_model.feature_names_)
+    if hasattr(xgb_model, 'feature_names_') and xgb_model.feature_names_:
+        expected_xgb = list(xgb_model.feature_names_)
+    # Fallback if XGBoost exposes via booster
+    if expected_xgb is None and hasattr(xgb_model, 'get_booster'):
+        try:
+            booster = xgb_model.get_booster()
+            names = getattr(booster, 'feature_names', None)
+            if names:
+                expected_xgb = list(names)
+        except Exception:
+            pass
+
+    # Prefer CatBoost order if present, else XGBoost, else configured list
+    return expected_cat or expected_xgb or (categorical_features + numeric_features)
+
+def load_scoring_context(timings: dict | None = None) -> dict:
+    """
+    Load ensemble models, encoder and stacking configuration once: from the compiled model
+    bundle when USE_MODEL_BUNDLE allows it and the bundle is usable, else from the loose files.
+    Returns a dict that score_transaction() reuses for every transaction.
+    With a timings dict, each loading step's seconds are recorded in it.
+    """
+    ctx = None
+    if USE_MODEL_BUNDLE != "false":
+        try:
+            ctx = load_model_bundle(timings=timings)
+        except Exception as e:
+            if USE_MODEL_BUNDLE == "true":
+                raise
+            if os.path.exists(MODEL_BUNDLE_PATH):
+                log.warning("Model bundle not used (%s); loading the model files", e)
+            if timings is not None:
+                timings.clear()
+    if ctx is None:
+        cat_model, xgb_model, rf_model, stacked_model, encoder = load_ensemble_models(timings)
+        base_order, decision_threshold = _timed(timings, "stacking_config", load_stacking_config)
+        # Compile LabelEncoders into dict lookups once, instead of on every transaction
+        encoder = _timed(timings, "compile_encoders", compile_encoders, encoder)
+        _timed(timings, "compile_bins", default_compiled_bins)
+        ctx = {
+            "cat_model": cat_model,
+            "xgb_model": xgb_model,
+            "rf_model": rf_model,
+            "stacked_model": stacked_model,
+            "encoder": encoder,
+            "base_order": base_order,
+            "decision_threshold": decision_threshold,
+            "expected_order": resolve_expected_order(cat_model, xgb_model),
+            "model_source": "files",
+        }
+    return _timed(timings, "tree_engine", apply_tree_engine, ctx, ctx.pop("flat_forests", None))
+
+# -----------------------
+# NumPy tree engine: RF / XGBoost scored by flattened forests (tree_engine.py)
+# -----------------------
+TREE_ENGINE_MODELS = ("rf", "xgb")
+
+def flatten_tree_models(models: dict) -> dict:
+    """tree_engine.FlatForest of each model ({"rf": rf_model, ...}) that can be flattened, by name."""
+    import tree_engine
+    forests = {}
+    for name, model in models.items():
+        try:
+            forests[name] = tree_engine.compile_forest(model)
+        except tree_engine.UnsupportedModel as e:
+            log.warning("%s model cannot use the NumPy tree engine: %s", name, e)
+    return forests
+
+def apply_tree_engine(ctx: dict, flat_forests: dict | None = None, models=None) -> dict:
+    """
+    Score the base models named in models (default NUMPY_TREE_MODELS) with flattened forests:
+    the precompiled ones of the model bundle, else flattened now. A model that cannot be
+    flattened keeps its library predict_proba. Records the engine per model in ctx["tree_engine"].
+    """
+    models = NUMPY_TREE_MODELS if models is None else models
+    engines = {"cat": "native", "xgb": "native", "rf": "native"}
+    for name in models:
+        if name not in TREE_ENGINE_MODELS:
+            log.warning("NUMPY_TREE_MODELS: %s is not a tree model the engine supports (rf, xgb)", name)
+            continue
+        import tree_engine
+        key = f"{name}_model"
+        forest = (flat_forests or {}).get(name)
+        if forest is None:
+            forest = flatten_tree_models({name: ctx[key]}).get(name)
+        if forest is None:
+            continue
+        ctx[key] = tree_engine.TreeEngineModel(ctx[key], forest, NUMPY_TREE_MAX_ROWS)
+        engines[name] = "numpy"
+    ctx["tree_engine"] = engines
+    return ctx
+
+# -----------------------
+# compiled model bundle: one versioned, checksummed artifact built by `compile-bundle`
+# -----------------------
+_BUNDLE_CAT_FILE = "cat_model.cbm"
+
+def _code_scoring_config() -> dict:
+    """Binning and feature configuration defined in this file; a bundle built with other values is not loaded."""
+    return {
+        "bins_config": bins_config,
+        "log_bin_features": LOG_BIN_FEATURES,
+        "categorical_features": categorical_features,
+        "numeric_features": numeric_features,
+    }
+
+def compile_model_bundle(path: str = None) -> dict:
+    """
+    Load the model files once and write the used models (CatBoost, XGBoost, Random Forest),
+    their flattened forests (NUMPY_TREE_MODELS), the encoders, the resolved feature order, the
+    stacking configuration and the binning configuration into a model bundle at path
+    (default MODEL_BUNDLE_PATH).
+    Returns a summary of the written bundle.
+    """
+    import model_bundle
+    path = path or MODEL_BUNDLE_PATH
+    cat_model, xgb_model, rf_model, _, encoder = load_ensemble_models()
+    base_order, decision_threshold = load_stacking_config()
+    sources = {"cat_model": CAT_MODEL_PATH, "xgb_model": XGB_MODEL_PATH, "rf_model": RF_MODEL_PATH}
+    for name, source in (("encoder", ENCODER_PATH), ("stacking_config", STACKING_CONFIG_PATH)):
+        if os.path.exists(source):
+            sources[name] = source
+    config = {
+        "expected_order": list(resolve_expected_order(cat_model, xgb_model)),
+        "base_order": list(base_order),
+        "decision_threshold": decision_threshold,
+        **_code_scoring_config(),
+    }
+    manifest = model_bundle.write_bundle(
+        path,
+        objects={"xgb_model": xgb_model, "rf_model": rf_model, "encoder": encoder,
+                 "flat_forests": flatten_tree_models({"xgb": xgb_model, "rf": rf_model})},
+        files={_BUNDLE_CAT_FILE: CAT_MODEL_PATH},
+        config=config,
+        sources=sources,
+    )
+    return {
+        "bundle": os.path.abspath(path),
+        "version": manifest["version"],
+        "files": manifest["files"],
+        "sources": sorted(manifest["sources"]),
+    }
+
+def load_model_bundle(path: str = None, timings: dict | None = None) -> dict:
+    """
+    Scoring context (see load_scoring_context) from the model bundle at path (default
+    MODEL_BUNDLE_PATH). Raises model_bundle.BundleError when the bundle is missing, from
+    another format version, older than the model files it was built from, built with other
+    bins or features than this file, or (with MODEL_BUNDLE_VERIFY) fails its checksums.
+    """
+    import model_bundle
+    path = path or MODEL_BUNDLE_PATH
+    manifest = _timed(timings, "bundle_manifest", model_bundle.read_manifest, path)
+    stale = model_bundle.stale_sources(manifest)
+    if stale:
+        raise model_bundle.BundleError(f"bundle is older than {', '.join(stale)}; rebuild it with compile-bundle")
+    config = manifest["config"]
+    changed = [key for key, value in _code_scoring_config().items() if config.get(key) != value]
+    if changed:
+        raise model_bundle.BundleError(f"bundle was built with other {', '.join(changed)}; rebuild it with compile-bundle")
+    if MODEL_BUNDLE_VERIFY:
+        _timed(timings, "bundle_verify", model_bundle.verify_files, path, manifest)
+    objects = _timed(timings, "bundle_objects", model_bundle.load_objects, path)
+    cat_model = _timed(timings, "cat_model", _load_catboost_model, os.path.join(path, _BUNDLE_CAT_FILE))
+    encoder = _timed(timings, "compile_encoders", compile_encoders, objects["encoder"])
+    _timed(timings, "compile_bins", default_compiled_bins)
+    return {
+        "cat_model": cat_model,
+        "xgb_model": objects["xgb_model"],
+        "rf_model": objects["rf_model"],
+        "stacked_model": None,
+        "encoder": encoder,
+        "base_order": list(config["base_order"]),
+        "decision_threshold": float(config["decision_threshold"]),
+        "expected_order": list(config["expected_order"]),
+        "model_source": f"bundle:{os.path.abspath(path)}",
+        "flat_forests": objects.get("flat_forests"),
+    }
+
+# -----------------------
+# key factors + persistence shared by single and batch scoring
+# -----------------------
+def extract_key_factors(mapped: dict) -> list:
+    """Simple heuristic key factors for one engineered transaction row."""
+    key_factors = []
+    try:
+        # Simple heuristic: flag amount_to_income_ratio large, or low kyc_score
+        atir = mapped.get("amount_to_income_ratio", None)
+        if atir is not None and not pd.isna(atir) and atir > 3:
+            key_factors.append("High amount-to-income ratio")
+        kyc = mapped.get("kyc_score", None)
+        if kyc is not None and not pd.isna(kyc) and float(kyc) < 40:
+            key_factors.append("Low KYC score")
+    except Exception:
+        pass
+    return key_factors
+
+# Client-supplied idempotency key fields (removed from the input before scoring)
+IDEMPOTENCY_KEY_FIELDS = ("idempotency_key", "idempotencyKey")
+
+def split_idempotency_key(input_json: dict) -> tuple:
+    """
+    (idempotency key, input without the key fields). Only a client-supplied key
+    deduplicates: without one the key is a fresh UUID, so two separate transactions with
+    the same content (e.g. repeated identical transfers) are always saved as two rows.
+    """
+    payload = {k: v for k, v in input_json.items() if k not in IDEMPOTENCY_KEY_FIELDS}
+    for field in IDEMPOTENCY_KEY_FIELDS:
+        key = input_json.get(field)
+        if key not in (None, ""):
+            return str(key), payload
+    return uuid.uuid4().hex, payload
+
+def build_transaction_row(binned_row: dict, prediction, confidence, key_factors, idempotency_key=None) -> dict:
+    """The single transaction-table row of a scored transaction: features (raw + binned) and outcome."""
+    row = dict(binned_row)
+    row.update({
+        "is_laundering": prediction,
+        "prediction": prediction,
+        "confidence": confidence,
+        "key_factors": key_factors,
+        "saved_at": datetime.now().isoformat(),
+    })
+    if idempotency_key:
+        row["idempotency_key"] = idempotency_key
+    return row
+
+def save_scored_transaction(row: dict) -> bool:
+    """Insert (or queue, see PredictionWriter) the combined row of one scored transaction (SAVE_TO_DB)."""
+    try:
+        saved = persist_row(row)
+        if saved:
+            log.debug("Transaction and prediction saved to database" if _PREDICTION_WRITER is None
+                      else "Transaction and prediction queued for database")
+        else:
+            log.warning("Failed to save transaction and prediction to database")
+        return saved
+    except Exception as e:
+        log.exception("Failed to save prediction results: %s", e)
+        return False
+
+# -----------------------
+# score one transaction with an already-loaded context
+# -----------------------
+def score_transaction(input_json: dict, ctx: dict) -> dict:
+    """
+    Run normalization, feature engineering, binning/encoding, ensemble prediction and
+    optional DB persistence for one transaction. Returns the JSON-serializable output
+    (or an {"error", "trace"} dict on failure). With SAVE_TO_DB the transaction is stored
+    as one row (features + outcome, keyed by its idempotency key) and the output carries
+    "persisted".
+    """
+    idempotency_key = None
+    if SAVE_TO_DB:
+        idempotency_key, input_json = split_idempotency_key(input_json)
+    mapped = normalize_input(input_json)
+
     # 2) Compute engineered features
-    print("\n=== INPUT FEATURES ===", file=sys.stderr)
-    for key, value in sorted(mapped.items()):
-        print(f"{key}: {value}", file=sys.stderr)
-    
-    mapped = compute_engineered_features(mapped) or mapped
-    
-    print("\n=== ALL COMPUTED FEATURES ===", file=sys.stderr)
-    for key, value in sorted(mapped.items()):
-        print(f"{key}: {value}", file=sys.stderr)
+    verbose = debug_enabled()
+    if verbose:
+        log.debug("\n".join(["=== INPUT FEATURES ==="] + [f"{k}: {v}" for k, v in sorted(mapped.items())]))
+
+    try:
+        mapped = compute_engineered_features(mapped) or mapped
+    except Exception as e:
+        tb = traceback.format_exc()
+        return {"error": f"failed to engineer features: {e}", "trace": tb}
+    missing = missing_model_inputs(mapped, ctx["expected_order"])
+    if missing:
+        return {"error": f"missing model inputs: {missing}"}
+
+    if verbose:
+        log.debug("\n".join(["=== ALL COMPUTED FEATURES ==="] + [f"{k}: {v}" for k, v in sorted(mapped.items())]))
 
     # NOTE: defer saving to CSV until after prediction so we can include
     # prediction, confidence and key_factors in the saved row.
@@ -1250,139 +2300,777 @@ def main():
     # 3) Convert single dict to DataFrame row (columns = keys)
     df_row = pd.DataFrame([mapped])
 
-
-    # 4) Load ensemble models + encoder
+    # 5) Prepare final X for models
     try:
-        cat_model, xgb_model, rf_model, stacked_model, encoder = load_ensemble_models()
+        # Prepare features with unified expected order for all models
+        X = prepare_features_for_model(df_row, ctx["encoder"], ctx["expected_order"])
+        if verbose:
+            _log_feature_block("FINAL FEATURES FOR MODEL", X, list(X.columns))
     except Exception as e:
         tb = traceback.format_exc()
-        print(json.dumps({"error": f"failed to load ensemble models: {e}", "trace": tb}))
-        return
-    # 4.1) Load stacking configuration
-    base_order, decision_threshold = load_stacking_config()
+        return {"error": f"failed to prepare features: {e}", "trace": tb}
 
-    # 5) Prepare final X for models
+    # 6) Ensemble Predict (4 base models + stacking)
     try:
-        # Determine expected orders from CatBoost and XGBoost if available
-        expected_cat = None
-        expected_xgb = None
-        if hasattr(cat_model, 'feature_names_') and cat_model.feature_names_:
-            expected_cat = list(cat_model.feature_names_)
-        if hasattr(xgb_model, 'feature_names_') and xgb_model.feature_names_:
-            expected_xgb = list(xgb_model.feature_names_)
-        # Fallback if XGBoost exposes via booster
-        if expected_xgb is None and hasattr(xgb_model, 'get_booster'):
-            try:
-                booster = xgb_model.get_booster()
-                names = getattr(booster, 'feature_names', None)
-                if names:
-                    expected_xgb = list(names)
-            except Exception:
-                pass
+        prediction, confidence, base_preds = ensemble_predict(
+            X, ctx["cat_model"], ctx["xgb_model"], ctx["rf_model"], ctx["stacked_model"],
+            ctx["base_order"], ctx["decision_threshold"],
+        )
+        prediction = str(prediction)  # Convert to string for consistent output
+    except Exception as e:
+        tb = traceback.format_exc()
+        return {"error": f"ensemble prediction failed: {e}", "trace": tb}
 
-        # Prefer CatBoost order if present, else XGBoost, else configured list
-        expected_order = expected_cat or expected_xgb or (categorical_features + numeric_features)
+    # Debug: prediction and base model outputs
+    if verbose:
+        log.debug("Prediction: %s", prediction)
+        if confidence is not None:
+            log.debug("Confidence: %s", confidence)
+        if base_preds is not None:
+            log.debug("Base model preds %s: %s", ctx["base_order"] or ["xgb", "rf", "cat"], np.asarray(base_preds).tolist())
 
-        # Prepare features with unified expected order for all models
-        X = prepare_features_for_model(df_row, encoder, expected_order)
-        print("\n=== FINAL FEATURES FOR MODEL ===", file=sys.stderr)
-        print(f"Feature columns: {list(X.columns)}", file=sys.stderr)
-        print(f"Feature values: {X.values[0].tolist()}", file=sys.stderr)
+    # 7) Optionally extract simple key_factors (placeholder)
+    key_factors = extract_key_factors(mapped)
+
+    # 8) Save the transaction with its prediction to database (disabled unless SAVE_TO_DB=true)
+    persisted = None
+    if SAVE_TO_DB:
+        try:
+            binned_row = apply_bins(df_row, bins_config, LOG_BIN_FEATURES).iloc[0].to_dict()
+            persisted = save_scored_transaction(
+                build_transaction_row(binned_row, prediction, confidence, key_factors, idempotency_key)
+            )
+        except Exception as e:
+            log.warning("Error saving transaction to database: %s", e, exc_info=True)
+            persisted = False
+        if persisted:
+            record_persisted_transaction(mapped)
+    else:
+        log.debug("SAVE_TO_DB=false: Skipping DB save of prediction results")
+
+    # 9) Output JSON
+    out = {
+        "prediction": prediction,
+        "confidence": confidence if confidence is not None else None,
+        "key_factors": key_factors
+    }
+    if ENSEMBLE_CASCADE:
+        out.update(cascade_report(base_preds, ctx["base_order"] or ["xgb", "rf", "cat"]))
+    if persisted is not None:
+        out["persisted"] = bool(persisted)
+    return out
+
+# -----------------------
+# score many transactions in one pass
+# -----------------------
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "10000"))
+
+def _record_binned_row(binned_row: dict, mapped: dict) -> dict:
+    """Restrict one row of a batch-binned frame to the columns a single-row score would have produced."""
+    return {
+        k: v for k, v in binned_row.items()
+        if k in mapped or (k.endswith("_binned") and k[:-len("_binned")] in mapped)
+    }
+
+def score_batch(records: list, ctx: dict) -> list:
+    """
+    Score a list of raw transactions (same keys as the single-transaction input).
+    Engineered features are computed per record; binning, encoding and all base models
+    then run once over a single DataFrame. Returns one output dict per record, in input
+    order, with prediction, confidence, key_factors and base_scores (per base model; None
+    for models the cascade skipped, see ENSEMBLE_CASCADE).
+    With SAVE_TO_DB each record is saved as one row and its output carries "persisted".
+    A record that is not an object, cannot be engineered or lacks model inputs gets an
+    {"error"} entry and is left out of the frame, which has the same columns
+    (model_input_columns) whatever the batch holds: a record scores as it would alone.
+    A failure to prepare or predict the batch as a whole raises RuntimeError.
+    """
+    now = datetime.now()
+    results = [None] * len(records)
+    accepted = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[i] = {"error": "invalid json input: expected a JSON object"}
+            continue
+        key = None
+        if SAVE_TO_DB:
+            key, record = split_idempotency_key(record)
+        try:
+            accepted.append((i, key, normalize_input(record)))
+        except Exception as e:
+            results[i] = {"error": f"invalid input: {e}"}
+    prefetch_history([mapped for _, _, mapped in accepted], now)
+
+    positions = []
+    idempotency_keys = []
+    rows = []
+    for i, key, mapped in accepted:
+        try:
+            mapped = compute_engineered_features(mapped, now) or mapped
+        except Exception as e:
+            results[i] = {"error": f"failed to engineer features: {e}"}
+            continue
+        missing = missing_model_inputs(mapped, ctx["expected_order"])
+        if missing:
+            results[i] = {"error": f"missing model inputs: {missing}"}
+            continue
+        positions.append(i)
+        idempotency_keys.append(key)
+        rows.append(mapped)
+    if not rows:
+        return results
+
+    columns = model_input_columns(tuple(ctx["expected_order"] or categorical_features + numeric_features))
+    df = pd.DataFrame({c: [mapped[c] for mapped in rows] for c in columns})
+    try:
+        X = prepare_features_for_model(df, ctx["encoder"], ctx["expected_order"])
     except Exception as e:
-        tb = traceback.format_exc()
-        print(json.dumps({"error": f"failed to prepare features: {e}", "trace": tb}))
+        raise RuntimeError(f"failed to prepare features: {e}")
+    try:
+        preds, confidences, base_predictions = ensemble_predict_batch(
+            X, ctx["cat_model"], ctx["xgb_model"], ctx["rf_model"], ctx["stacked_model"],
+            ctx["base_order"], ctx["decision_threshold"],
+        )
+    except Exception as e:
+        raise RuntimeError(f"ensemble prediction failed: {e}")
+
+    base_order = ctx["base_order"] or ["xgb", "rf", "cat"]
+    # saved rows keep every engineered column; binning is per value, so the union frame is safe here
+    binned_rows = apply_bins(pd.DataFrame(rows), bins_config, LOG_BIN_FEATURES).to_dict("records") if SAVE_TO_DB else None
+    for j, (i, mapped) in enumerate(zip(positions, rows)):
+        prediction = str(int(preds[j]))
+        confidence = float(confidences[j])
+        key_factors = extract_key_factors(mapped)
+        results[i] = {
+            "prediction": prediction,
+            "confidence": confidence,
+            "key_factors": key_factors,
+            "base_scores": {
+                name: None if np.isnan(base_predictions[j, k]) else float(base_predictions[j, k])
+                for k, name in enumerate(base_order)
+            },
+        }
+        if ENSEMBLE_CASCADE:
+            results[i].update(cascade_report(base_predictions[j], base_order))
+        if SAVE_TO_DB:
+            try:
+                persisted = save_scored_transaction(build_transaction_row(
+                    _record_binned_row(binned_rows[j], mapped), prediction, confidence, key_factors,
+                    idempotency_keys[j],
+                ))
+            except Exception as e:
+                log.warning("Error saving transaction to database: %s", e)
+                persisted = False
+            if persisted:
+                record_persisted_transaction(mapped, now)
+            results[i]["persisted"] = bool(persisted)
+    return results
+
+def score_records_chunked(records: list, ctx: dict, chunk_size: int = None) -> list:
+    """
+    score_batch over fixed-size chunks so intermediate frames stay bounded. When a chunk
+    fails as a whole, its records are scored one by one, so only the rows that fail on
+    their own get error entries.
+    """
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    results = []
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        try:
+            results.extend(score_batch(chunk, ctx))
+        except Exception as e:
+            log.warning("Chunk of %d records failed (%s); scoring its records one by one", len(chunk), e)
+            for record in chunk:
+                try:
+                    results.extend(score_batch([record], ctx))
+                except Exception as e:
+                    tb = traceback.format_exc()
+                    results.append({"error": str(e), "trace": tb})
+    return results
+
+def run_batch(path: str = "-", workers: int = None):
+    """
+    Batch CLI: read a JSON array (output: JSON array) or JSONL (output: JSONL) of
+    transactions from path or stdin ("-") and print one result per transaction.
+    With workers > 1 the records are scored by a process pool.
+    """
+    if path in (None, "-"):
+        raw = sys.stdin.read()
+    else:
+        with open(path, encoding="utf-8") as fh:
+            raw = fh.read()
+    if not raw.strip():
+        print(json.dumps({"error": "no input received"}))
         return
 
-    # Optionally save binned features to DB now (after log-preview & unified binning)
-    if SAVE_TO_DB:
+    as_array = raw.lstrip().startswith("[")
+    parse_errors = {}
+    if as_array:
         try:
-            df_binned = apply_bins(df_row, bins_config, LOG_BIN_FEATURES)
-            save_row_binned = df_binned.iloc[0].to_dict()
-            inserted_binned = insert_prediction_into_db(save_row_binned)
-            if inserted_binned:
-                print("[INFO] Binned features saved to database", file=sys.stderr)
-            else:
-                print("[WARN] Failed to save binned features to database", file=sys.stderr)
+            records = json.loads(raw)
         except Exception as e:
-            print(f"[WARN] Error saving binned features: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+            print(json.dumps({"error": f"invalid json input: {e}"}))
+            return
     else:
-        print("[INFO] SAVE_TO_DB=false: Skipping DB save of binned features", file=sys.stderr)
+        records = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except Exception as e:
+                parse_errors[len(records)] = f"invalid json input: {e}"
+                records.append(None)
 
-    # 6) Ensemble Predict (4 base models + stacking)
+    workers = resolve_worker_count(workers)
+    started = time.perf_counter()
     try:
-        prediction, confidence, base_preds = ensemble_predict(X, cat_model, xgb_model, rf_model, stacked_model, base_order, decision_threshold)
-        prediction = str(prediction)  # Convert to string for consistent output
+        if workers > 1:
+            results = score_records_parallel(records, workers)
+        else:
+            ctx = load_scoring_context()
+            start_prediction_writer()
+            try:
+                results = score_records_chunked(records, ctx)
+            finally:
+                close_prediction_writer()
     except Exception as e:
         tb = traceback.format_exc()
-        print(json.dumps({"error": f"ensemble prediction failed: {e}", "trace": tb}))
+        print(json.dumps({"error": f"failed to load ensemble models: {e}", "trace": tb}))
         return
+    for idx, msg in parse_errors.items():
+        results[idx] = {"error": msg}
+    elapsed = time.perf_counter() - started
+    log.info("Scored %d transactions in %.2fs (%.1f rows/s, %d worker(s))",
+             len(records), elapsed, len(records) / elapsed if elapsed > 0 else 0, workers)
+
+    if as_array:
+        print(json.dumps(results))
+    else:
+        for result in results:
+            print(json.dumps(result))
 
-    # Debug: print features (as used) after obtaining prediction
+# -----------------------
+# multi-core scoring: process pool whose workers load the ensemble once
+# -----------------------
+SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS", "1"))
+# Load the ensemble once in the parent and fork the pool workers from it, so they share the
+# model and library memory copy-on-write instead of each loading a private copy (fork platforms only)
+SCORING_PRELOAD = os.environ.get("SCORING_PRELOAD", "true").strip().lower() == "true"
+
+# Scoring context of a pool worker process, set once by _init_scoring_worker
+_WORKER_CTX = None
+
+def resolve_worker_count(workers=None) -> int:
+    """Worker count from the argument or SCORING_WORKERS; 0 means one per CPU core."""
+    workers = SCORING_WORKERS if workers is None else int(workers)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def process_memory(pid="self") -> dict | None:
+    """
+    RSS, PSS (shared pages split between the processes mapping them) and USS (private pages)
+    of a process in kB, from /proc/<pid>/smaps_rollup. None where that is unavailable.
+    """
+    fields = {}
     try:
-        _print_feature_block("FEATURES USED FOR PREDICTION (POST-PREDICTION ECHO)", X, list(X.columns))
-        print(f"[DEBUG] Prediction: {prediction}", file=sys.stderr)
-        if 'confidence' in locals() and confidence is not None:
-            print(f"[DEBUG] Confidence: {confidence}", file=sys.stderr)
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        "rss_kb": fields.get("Rss"),
+        "pss_kb": fields.get("Pss"),
+        "uss_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+def _init_scoring_worker(ctx=None, workers: int = None):
+    global _WORKER_CTX
+    # a preloaded context is inherited from the parent through fork, not pickled
+    _WORKER_CTX = ctx if ctx is not None else load_scoring_context()
+    # thread limits of a forked parent are not always inherited (OpenMP keeps them per thread)
+    apply_thread_budget(_WORKER_CTX, resolve_thread_budget(workers))
+    start_prediction_writer()
+
+def _score_chunk_in_worker(records: list) -> list:
+    results = score_records_chunked(records, _WORKER_CTX, len(records) or 1)
+    # pool workers exit without running atexit handlers: write the chunk's rows before returning
+    flush_prediction_writer()
+    return results
+
+def make_scoring_pool(workers: int, preload: bool = None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Process pool of scoring workers that load the ensemble once and reuse it. With preload
+    (default SCORING_PRELOAD) and fork available, the ensemble is loaded here and the workers
+    are forked with it; otherwise each worker loads its own copy at startup.
+    Close it with close_scoring_pool(), which reports the workers' memory.
+    """
+    preload = SCORING_PRELOAD if preload is None else preload
+    if preload and "fork" in multiprocessing.get_all_start_methods():
+        ctx = apply_thread_budget(load_scoring_context(), resolve_thread_budget(workers))
+        # Objects that exist now move to the permanent generation: the collector in the
+        # workers never walks them, so it does not dirty the shared pages they live on.
+        # Reference counting still writes to the headers of the objects a worker touches.
+        gc.freeze()
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_scoring_worker, initargs=(ctx, workers),
+        )
+        pool.preloaded = True
+        return pool
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_scoring_worker,
+                                                  initargs=(None, workers))
+    pool.preloaded = False
+    return pool
+
+def scoring_pool_memory(pool: concurrent.futures.ProcessPoolExecutor) -> dict:
+    """Memory of each live pool worker (see process_memory) and the per-worker means, in kB."""
+    pids = sorted(getattr(pool, "_processes", None) or {})
+    per_worker = [dict(pid=pid, **mem) for pid in pids if (mem := process_memory(pid)) is not None]
+    report = {"preloaded": pool.preloaded, "workers": per_worker}
+    for key in ("rss_kb", "pss_kb", "uss_kb"):
+        report[key + "_mean"] = round(sum(w[key] for w in per_worker) / len(per_worker)) if per_worker else None
+    return report
+
+def close_scoring_pool(pool: concurrent.futures.ProcessPoolExecutor, cancel_futures: bool = False) -> dict:
+    """Log and return the workers' memory (scoring_pool_memory), then shut the pool down."""
+    memory = scoring_pool_memory(pool)
+    if memory["workers"]:
+        log.info("Scoring workers: %d (%s), per worker USS %.1f MB, PSS %.1f MB, RSS %.1f MB",
+                 len(memory["workers"]), "preloaded, forked" if pool.preloaded else "loaded per worker",
+                 memory["uss_kb_mean"] / 1024, memory["pss_kb_mean"] / 1024, memory["rss_kb_mean"] / 1024)
+    pool.shutdown(cancel_futures=cancel_futures)
+    if pool.preloaded:
+        gc.unfreeze()
+    return memory
+
+def score_records_parallel(records: list, workers: int, chunk_size: int = None) -> list:
+    """Fan records out over a pool of workers in chunks; results come back in input order."""
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    # Small enough chunks that every worker gets several, for load balancing
+    chunk_size = max(1, min(chunk_size, -(-len(records) // (workers * 4))))
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    results = []
+    pool = make_scoring_pool(workers)
+    try:
+        for chunk_results in pool.map(_score_chunk_in_worker, chunks):
+            results.extend(chunk_results)
+    finally:
+        close_scoring_pool(pool, cancel_futures=True)
+    return results
+
+# -----------------------
+# streaming file scorer: CSV/Parquet in, CSV/JSONL out, bounded memory, resumable
+# -----------------------
+SCORE_FILE_CHUNK_SIZE = int(os.environ.get("SCORE_FILE_CHUNK_SIZE", "10000"))
+
+_SCORE_FILE_FIELDS = ["row_index", "account", "account_1", "prediction", "confidence",
+                      "key_factors", "score_xgb", "score_rf", "score_cat", "error"]
+
+def _iter_input_chunks(path: str, chunk_size: int):
+    """Yield DataFrame chunks of at most chunk_size rows from a CSV or Parquet file."""
+    if path.lower().endswith((".parquet", ".pq")):
         try:
-            # base_preds is a 1D array of base model outputs if available
-            if base_preds is not None:
-                print(f"[DEBUG] Base model preds [xgb, rf, cat]: {base_preds.tolist()}", file=sys.stderr)
-                try:
-                    names = ["xgb", "rf", "cat"]
-                    for i, n in enumerate(names):
-                        if i < len(base_preds):
-                            print(f"[DEBUG] {n} score: {float(base_preds[i])}", file=sys.stderr)
-                except Exception:
-                    pass
-        except Exception:
-            pass
-    except Exception:
-        pass
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet input requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # Cells are read verbatim as strings (account numbers keep leading zeros, empty
+        # cells stay ""), the same values the API receives when ab.md posts CSV rows.
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+def _chunk_records(chunk: pd.DataFrame) -> list:
+    """DataFrame chunk -> transaction dicts; null cells (Parquet) are treated like missing keys."""
+    records = []
+    for rec in chunk.to_dict("records"):
+        records.append({k: v for k, v in rec.items() if v is not None and not (isinstance(v, float) and np.isnan(v))})
+    return records
+
+def _score_file_rows(records: list, results: list, first_row: int) -> list:
+    rows = []
+    for offset, (record, result) in enumerate(zip(records, results)):
+        ids = normalize_input(record)
+        base_scores = result.get("base_scores", {})
+        rows.append({
+            "row_index": first_row + offset,
+            "account": ids.get("account"),
+            "account_1": ids.get("account_1"),
+            "prediction": result.get("prediction"),
+            "confidence": result.get("confidence"),
+            "key_factors": result.get("key_factors"),
+            "score_xgb": base_scores.get("xgb"),
+            "score_rf": base_scores.get("rf"),
+            "score_cat": base_scores.get("cat"),
+            "error": result.get("error"),
+        })
+    return rows
+
+def _write_checkpoint(path: str, state: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+def score_file(input_path: str, output_path: str, chunk_size: int = None, resume: bool = False,
+               ctx: dict = None, workers: int = None) -> dict:
+    """
+    Stream input_path in chunks of chunk_size rows, score each chunk with score_batch and
+    append the results to output_path (.jsonl/.ndjson -> JSONL, otherwise CSV).
+    After every chunk the output is fsync'ed and <output>.ckpt.json records the completed
+    chunks; with resume=True a crashed run continues after the last completed chunk.
+    With workers > 1 chunks are scored in a process pool and written back in input order.
+    Returns a summary dict (rows, chunks, seconds, rows_per_second).
+    """
+    chunk_size = chunk_size or SCORE_FILE_CHUNK_SIZE
+    checkpoint_path = output_path + ".ckpt.json"
+    as_jsonl = output_path.lower().endswith((".jsonl", ".ndjson"))
+    state = {
+        "input": os.path.abspath(input_path),
+        "chunk_size": chunk_size,
+        "chunks_done": 0,
+        "rows_done": 0,
+        "output_bytes": 0,
+    }
 
-    # 7) Optionally extract simple key_factors (placeholder)
-    key_factors = []
+    resumed = False
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as fh:
+            saved = json.load(fh)
+        if saved.get("input") != state["input"] or saved.get("chunk_size") != chunk_size:
+            raise RuntimeError(
+                f"checkpoint {checkpoint_path} was written for {saved.get('input')} "
+                f"with chunk size {saved.get('chunk_size')}; cannot resume with different settings"
+            )
+        if os.path.exists(output_path) and os.path.getsize(output_path) >= saved.get("output_bytes", 0):
+            state = saved
+            resumed = True
+            # Drop any partial chunk written after the last checkpoint
+            with open(output_path, "r+b") as fh:
+                fh.truncate(state["output_bytes"])
+            log.info("Resuming after chunk %d (%d rows done)", state["chunks_done"], state["rows_done"])
+        else:
+            log.warning("Output %s is missing or shorter than its checkpoint; scoring from the start", output_path)
+    if not resumed:
+        open(output_path, "w").close()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    workers = resolve_worker_count(workers)
+    pool = make_scoring_pool(workers) if workers > 1 else None
+    if pool is None:
+        ctx = ctx or load_scoring_context()
+        start_prediction_writer()
+    started = time.perf_counter()
+    rows_scored = 0
     try:
-        # Simple heuristic: flag amount_to_income_ratio large, or low kyc_score
-        atir = mapped.get("amount_to_income_ratio", None)
-        if atir is not None and not pd.isna(atir) and atir > 3:
-            key_factors.append("High amount-to-income ratio")
-        kyc = mapped.get("kyc_score", None)
-        if kyc is not None and not pd.isna(kyc) and float(kyc) < 40:
-            key_factors.append("Low KYC score")
-    except Exception:
-        pass
+        with open(output_path, "a", newline="", encoding="utf-8") as out:
+            writer = None if as_jsonl else csv.DictWriter(out, fieldnames=_SCORE_FILE_FIELDS)
+            if writer is not None and state["output_bytes"] == 0:
+                writer.writeheader()
+
+            def write_chunk(chunk_no, records, results, chunk_started):
+                nonlocal rows_scored
+                rows = _score_file_rows(records, results, state["rows_done"])
+                if as_jsonl:
+                    for row in rows:
+                        out.write(json.dumps(row) + "\n")
+                else:
+                    for row in rows:
+                        if row["key_factors"] is not None:
+                            row["key_factors"] = json.dumps(row["key_factors"])
+                    writer.writerows(rows)
+                out.flush()
+                os.fsync(out.fileno())
+                # DB rows of the chunk are written before the checkpoint covers it
+                flush_prediction_writer()
+
+                rows_scored += len(rows)
+                state["chunks_done"] = chunk_no + 1
+                state["rows_done"] += len(rows)
+                state["output_bytes"] = out.tell()
+                _write_checkpoint(checkpoint_path, state)
+
+                chunk_elapsed = time.perf_counter() - chunk_started
+                total_elapsed = time.perf_counter() - started
+                log.info("chunk %d: %d rows in %.2fs (%.1f rows/s, overall %.1f rows/s)",
+                         chunk_no + 1, len(rows), chunk_elapsed,
+                         len(rows) / chunk_elapsed if chunk_elapsed > 0 else 0,
+                         rows_scored / total_elapsed if total_elapsed > 0 else 0)
+
+            # With a pool, keep at most 2 chunks per worker in flight and write them back
+            # strictly in input order so the checkpoint always covers a contiguous prefix.
+            pending = collections.deque()
+            for chunk_no, chunk in enumerate(_iter_input_chunks(input_path, chunk_size)):
+                if chunk_no < state["chunks_done"]:
+                    continue
+                chunk_started = time.perf_counter()
+                records = _chunk_records(chunk)
+                if pool is None:
+                    write_chunk(chunk_no, records, score_records_chunked(records, ctx, len(records) or 1), chunk_started)
+                    continue
+                pending.append((chunk_no, records, chunk_started, pool.submit(_score_chunk_in_worker, records)))
+                while len(pending) >= workers * 2:
+                    done_no, done_records, done_started, future = pending.popleft()
+                    write_chunk(done_no, done_records, future.result(), done_started)
+            while pending:
+                done_no, done_records, done_started, future = pending.popleft()
+                write_chunk(done_no, done_records, future.result(), done_started)
+    finally:
+        if pool is not None:
+            worker_memory = close_scoring_pool(pool, cancel_futures=True)
+        else:
+            close_prediction_writer()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "output": output_path,
+        "rows": state["rows_done"],
+        "rows_scored": rows_scored,
+        "chunks": state["chunks_done"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_scored / elapsed, 1) if elapsed > 0 else None,
+        "workers": workers,
+        "worker_memory": worker_memory if pool is not None else None,
+    }
 
-    # 8) Save prediction results to database (disabled unless SAVE_TO_DB=true)
-    if SAVE_TO_DB:
+# -----------------------
+# top-level: read stdin JSON, process, predict, print output
+# -----------------------
+def main():
+    # input errors are answered before any model or heavy library is loaded
+    raw = sys.stdin.read()
+    if not raw.strip():
+        print(json.dumps({"error": "no input received"}))
+        return
+
+    try:
+        input_json = json.loads(raw)
+    except Exception as e:
+        print(json.dumps({"error": f"invalid json input: {e}"}))
+        return
+    if not isinstance(input_json, dict):
+        print(json.dumps({"error": "invalid json input: expected a JSON object"}))
+        return
+    # "_debug": true turns on the diagnostic dump on stderr for this run
+    if input_json.pop("_debug", False):
+        configure_logging(logging.DEBUG)
+    log.debug("=== PREDICT.PY VERSION: 2024-12-16-FIX === python %s, cwd %s", sys.executable, os.getcwd())
+
+    # 4) Load ensemble models + encoder (+ stacking configuration)
+    try:
+        ctx = load_scoring_context()
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(json.dumps({"error": f"failed to load ensemble models: {e}", "trace": tb}))
+        return
+
+    print(json.dumps(score_transaction(input_json, ctx)))
+
+# -----------------------
+# long-lived worker: load models once, score newline-delimited JSON requests
+# -----------------------
+def serve(in_stream=None, out_stream=None):
+    """
+    Read one JSON transaction per line and write one JSON response per line.
+    Reserved request keys: "_id" is echoed back in the response, "_debug": true
+    returns the debug log of that request under "debug", and
+    "_batch": [...] scores a list of transactions, answered as {"results": [...]}.
+    Control requests carry "_command" instead of a transaction: {"_command": "stats"}
+    returns where the models were loaded from (bundle or files), the engine scoring each
+    base model (native or numpy), the thread budget in effect, the process memory
+    (RSS/PSS/USS, see process_memory), the per-column encoder
+    fallback counters (add "reset": true to zero them)
+    and, with USE_DB_FEATURES, the sender/beneficiary feature store counters
+    (plus the DB connection pool and write-behind buffer metrics once the database was used),
+    and with ENSEMBLE_CASCADE the per-model cost estimates and early-exit counts.
+    A {"status": "ready"} line is written once the models are loaded.
+    """
+    in_stream = in_stream or sys.stdin
+    out_stream = out_stream or sys.stdout
+    # Keep stray library prints off the protocol stream
+    sys.stdout = sys.stderr
+
+    def respond(payload):
+        out_stream.write(json.dumps(payload) + "\n")
+        out_stream.flush()
+
+    log.info("predict.py serve mode (pid %d)", os.getpid())
+    try:
+        # one of SCORING_WORKERS long-lived processes; one-shot runs keep the library defaults
+        ctx = apply_thread_budget(load_scoring_context(), resolve_thread_budget())
+    except Exception as e:
+        tb = traceback.format_exc()
+        respond({"error": f"failed to load ensemble models: {e}", "trace": tb})
+        return
+    start_prediction_writer()
+    respond({"status": "ready"})
+
+    for line in in_stream:
+        line = line.strip()
+        if not line:
+            continue
         try:
-            save_row_prediction = {
-                "is_laundering": prediction,
-                "prediction": prediction,
-                "confidence": confidence if 'confidence' in locals() else None,
-                "key_factors": key_factors,
-                "saved_at": datetime.now().isoformat()
-            }
-            print("\n=== SAVING PREDICTION RESULTS TO DATABASE ===", file=sys.stderr)
-            inserted_prediction = insert_prediction_into_db(save_row_prediction)
-            if inserted_prediction:
-                print("[INFO] Prediction results saved to database", file=sys.stderr)
+            request = json.loads(line)
+        except Exception as e:
+            respond({"error": f"invalid json input: {e}"})
+            continue
+        if not isinstance(request, dict):
+            respond({"error": "invalid json input: expected a JSON object"})
+            continue
+
+        request_id = request.pop("_id", None)
+        command = request.pop("_command", None)
+        if command is not None:
+            if command == "stats":
+                out = {"models": ctx["model_source"], "tree_engine": ctx["tree_engine"],
+                       "thread_budget": ctx["thread_budget"], "memory": process_memory(),
+                       "encoders": encoder_stats(ctx["encoder"], reset=bool(request.get("reset", False)))}
+                if _FEATURE_STORE is not None:
+                    out["feature_store"] = _FEATURE_STORE.stats()
+                if "db_config" in sys.modules:
+                    out["db_pool"] = sys.modules["db_config"].pool_stats()
+                if _PREDICTION_WRITER is not None:
+                    out["db_writer"] = _PREDICTION_WRITER.stats()
+                if ENSEMBLE_CASCADE:
+                    out["cascade"] = MODEL_COSTS.stats()
             else:
-                print("[WARN] Failed to save prediction results to database", file=sys.stderr)
+                out = {"error": f"unknown command: {command}"}
+            if request_id is not None:
+                out["_id"] = request_id
+            respond(out)
+            continue
+        want_debug = bool(request.pop("_debug", False))
+        batch = request.pop("_batch", None)
+        try:
+            with capture_debug_log() if want_debug else contextlib.nullcontext() as debug_buf:
+                if batch is not None:
+                    out = {"results": score_records_chunked(batch, ctx)}
+                else:
+                    out = score_transaction(request, ctx)
         except Exception as e:
-            print(f"[ERROR] Failed to save prediction results: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+            out = {"error": f"scoring failed: {e}", "trace": traceback.format_exc()}
+        if request_id is not None:
+            out["_id"] = request_id
+        if want_debug:
+            out["debug"] = debug_buf.getvalue()
+        respond(out)
+    close_prediction_writer()
+
+
+# -----------------------
+# startup profile: where cold-start time goes
+# -----------------------
+# in dependency order, so each figure is what that library adds on top of the previous ones
+STARTUP_PROFILE_MODULES = ("numpy", "pandas", "joblib", "sklearn", "xgboost", "catboost")
+
+# transaction scored (twice) by the startup profile
+_PROFILE_TRANSACTION = {
+    "fromBank": "1", "fromAccount": "PROFILE-A", "toBank": "2", "toAccount": "PROFILE-B",
+    "amount": 1500.0, "amountReceived": 1500.0, "paymentCurrency": "US Dollar",
+    "receivingCurrency": "US Dollar", "paymentFormat": "Wire", "nationality": "US",
+    "occupation": "Engineer", "kycStatus": "verified", "kycScore": 80, "isPep": 0,
+    "monthlyIncome": 5000, "dob": "1985-04-12", "customerSince": "2018-01-01",
+}
+
+def startup_profile() -> dict:
+    """
+    Seconds spent importing predict.py itself, each heavy library, loading each model and
+    scoring a first and second transaction (without DB features or saving). Meaningful in
+    a fresh process only.
+    """
+    global SAVE_TO_DB, USE_DB_FEATURES
+    SAVE_TO_DB = USE_DB_FEATURES = False
+    report = {"predict_module": round(_MODULE_LOADED - _STARTED, 4), "imports": {}, "models": {}}
+    for name in STARTUP_PROFILE_MODULES:
+        try:
+            _timed(report["imports"], name, importlib.import_module, name)
+        except ImportError as e:
+            report["imports"][name] = f"not available: {e}"
+    ctx = load_scoring_context(timings=report["models"])
+    _timed(report["models"], "thread_budget", apply_thread_budget, ctx, resolve_thread_budget())
+    report["model_source"] = ctx["model_source"]
+    report["tree_engine"] = ctx["tree_engine"]
+    report["thread_budget"] = ctx["thread_budget"]
+    for label in ("first_score", "second_score"):
+        _timed(report, label, score_transaction, dict(_PROFILE_TRANSACTION), ctx)
+    report["total"] = round(time.perf_counter() - _STARTED, 4)
+    return report
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="AML ensemble scoring. Without options, scores one JSON transaction read from stdin."
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--serve", action="store_true",
+                      help="long-lived worker: one JSON transaction per stdin line, one JSON response per line")
+    mode.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                      help="score a JSON array or JSONL file of transactions (default: stdin)")
+    mode.add_argument("--startup-profile", action="store_true",
+                      help="print seconds per import, per model load and for the first scores as JSON")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="scoring processes for --batch (default SCORING_WORKERS or 1; 0 = one per core)")
+    sub = parser.add_subparsers(dest="command")
+    score_file_parser = sub.add_parser(
+        "score-file", help="stream a CSV/Parquet file of transactions through the ensemble in chunks"
+    )
+    score_file_parser.add_argument("input", help="input .csv or .parquet (raw CSV column names are accepted)")
+    score_file_parser.add_argument("output", help="output .csv or .jsonl")
+    score_file_parser.add_argument("--chunk-size", type=int, default=SCORE_FILE_CHUNK_SIZE,
+                                   help=f"rows per chunk (default {SCORE_FILE_CHUNK_SIZE})")
+    score_file_parser.add_argument("--resume", action="store_true",
+                                   help="continue after the last completed chunk recorded in <output>.ckpt.json")
+    score_file_parser.add_argument("--workers", type=int, default=None,
+                                   help="scoring processes (default SCORING_WORKERS or 1; 0 = one per core)")
+    replay_parser = sub.add_parser(
+        "replay-spill", help="write prediction rows spilled after DB failures back to the transaction table"
+    )
+    replay_parser.add_argument("path", nargs="?", default=None, help=f"spill file (default DB_SPILL_PATH: {DB_SPILL_PATH})")
+    replay_parser.add_argument("--allow-duplicates", action="store_true",
+                               help="replay without a unique idempotency_key index (rows already stored are inserted again)")
+    bundle_parser = sub.add_parser(
+        "compile-bundle", help="bundle the models, encoders and scoring configuration into one checksummed artifact"
+    )
+    bundle_parser.add_argument("--output", default=None, help=f"bundle directory (default MODEL_BUNDLE_PATH: {MODEL_BUNDLE_PATH})")
+    args = parser.parse_args(argv)
+
+    if args.command == "score-file":
+        try:
+            summary = score_file(args.input, args.output, args.chunk_size, args.resume, workers=args.workers)
+        except Exception as e:
+            print(json.dumps({"error": f"score-file failed: {e}", "trace": traceback.format_exc()}))
+            sys.exit(1)
+        print(json.dumps(summary))
+    elif args.command == "replay-spill":
+        summary = replay_spilled_predictions(args.path, args.allow_duplicates)
+        print(json.dumps(summary))
+        if "error" in summary:
+            sys.exit(1)
+    elif args.command == "compile-bundle":
+        try:
+            summary = compile_model_bundle(args.output)
+        except Exception as e:
+            print(json.dumps({"error": f"compile-bundle failed: {e}", "trace": traceback.format_exc()}))
+            sys.exit(1)
+        print(json.dumps(summary))
+    elif args.startup_profile:
+        print(json.dumps(startup_profile(), indent=2))
+    elif args.serve:
+        serve()
+    elif args.batch is not None:
+        run_batch(args.batch, args.workers)
     else:
-        print("[INFO] SAVE_TO_DB=false: Skipping DB save of prediction results", file=sys.stderr)
+        main()
 
-    # 9) Output JSON
-    out = {
-        "prediction": prediction,
-        "confidence": confidence if confidence is not None else None,
-        "key_factors": key_factors
-    }
-    print(json.dumps(out))
 
+_MODULE_LOADED = time.perf_counter()
 
 if __name__ == "__main__":
-    main()
+    cli()
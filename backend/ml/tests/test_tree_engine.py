@@ -0,0 +1,88 @@
+"""
+Parity of the NumPy flattened forests (tree_engine.py) with the library predict_proba, on
+stand-in Random Forest and XGBoost models trained on synthetic transactions
+(benchmarks/synthetic.py), so no models/ directory is needed.
+
+    python -m pytest backend/ml/tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+import synthetic  # noqa: E402
+import tree_engine  # noqa: E402
+
+TOLERANCE = {"rf": tree_engine.RF_TOLERANCE, "xgb": tree_engine.XGB_TOLERANCE}
+# one row, just over one traversal block, and a large batch
+BATCH_SIZES = [1, tree_engine.FlatForest.BLOCK_ROWS + 1, 10000]
+
+
+def _with_missing(X, rng, fraction):
+    """Float copy of X with a fraction of the numeric values set to NaN."""
+    X = X.astype(np.float64)
+    for col in synthetic.predict.numeric_features:
+        if col in X.columns:
+            X.loc[rng.random(len(X)) < fraction, col] = np.nan
+    return X
+
+
+@pytest.fixture(scope="module")
+def models():
+    from sklearn.ensemble import RandomForestClassifier
+    from xgboost import XGBClassifier
+
+    X, y, _ = synthetic.training_data(3000, seed=0)
+    # some missing values in training too, so both libraries learn a default direction
+    X = _with_missing(X, np.random.default_rng(0), 0.05)
+    return {
+        "rf": RandomForestClassifier(n_estimators=30, max_depth=10, random_state=0).fit(X, y),
+        "xgb": XGBClassifier(n_estimators=30, max_depth=5, random_state=0).fit(X, y),
+    }
+
+
+@pytest.fixture(scope="module")
+def scoring_rows(models):
+    """Unseen rows: a quarter of the values set exactly on a split threshold, 2% missing."""
+    X, _, _ = synthetic.training_data(max(BATCH_SIZES), seed=1)
+    rng = np.random.default_rng(1)
+    X = X.astype(np.float64)
+    forests = [tree_engine.compile_forest(m) for m in models.values()]
+    for i, col in enumerate(X.columns):
+        thresholds = np.concatenate([
+            f.threshold[(f.feature == i) & (f.child != np.arange(f.n_nodes))].astype(np.float64) for f in forests
+        ])
+        thresholds = thresholds[np.isfinite(thresholds)]  # sklearn splits missing-vs-rest at +inf
+        if len(thresholds):
+            on_split = rng.random(len(X)) < 0.25
+            X.loc[on_split, col] = rng.choice(thresholds, on_split.sum())
+    return _with_missing(X, rng, 0.02)
+
+
+@pytest.mark.parametrize("name", ["rf", "xgb"])
+@pytest.mark.parametrize("rows", BATCH_SIZES)
+def test_flat_forest_matches_library(models, scoring_rows, name, rows):
+    forest = tree_engine.compile_forest(models[name])
+    for X in (scoring_rows.iloc[:rows], scoring_rows.iloc[:rows].fillna(0)):
+        native = models[name].predict_proba(X)
+        flat = forest.predict_proba(X)
+        assert flat.shape == native.shape
+        assert np.abs(flat - native).max() <= TOLERANCE[name]
+
+
+@pytest.mark.parametrize("name", ["rf", "xgb"])
+def test_tree_engine_model_falls_back_above_max_rows(models, scoring_rows, name):
+    forest = tree_engine.compile_forest(models[name])
+    model = tree_engine.TreeEngineModel(models[name], forest, max_rows=100)
+    small, large = scoring_rows.iloc[:100], scoring_rows.iloc[:101]
+    np.testing.assert_array_equal(model.predict_proba(small), forest.predict_proba(small))
+    np.testing.assert_array_equal(model.predict_proba(large), models[name].predict_proba(large))
+
+
+def test_unsupported_model():
+    with pytest.raises(tree_engine.UnsupportedModel):
+        tree_engine.compile_forest(object())
@@ -0,0 +1,267 @@
+"""
+Pure-NumPy evaluator for the tree ensembles scored by predict.py (NUMPY_TREE_MODELS).
+
+A fitted scikit-learn RandomForestClassifier or XGBoost XGBClassifier (binary:logistic,
+gbtree, numeric splits) is flattened once into contiguous node arrays, every tree
+concatenated, and evaluated over a float32 feature matrix by walking all rows through all
+trees at once, one tree level per step. This skips the per-call framework work (input
+validation, DataFrame -> DMatrix conversion, joblib dispatch over the trees) that dominates
+small batches.
+
+Parity with the native predict_proba: both libraries compare float32 inputs, sklearn as
+x <= float64 threshold, XGBoost as x < float32 threshold, and the flattened forest does
+the same, so every row reaches the same leaves. Only the summation differs:
+RandomForest probabilities match to 1e-12, XGBoost (float32 margin in the library, float64
+here) to 1e-6.
+"""
+import json
+
+import numpy as np
+
+RF_TOLERANCE = 1e-12
+XGB_TOLERANCE = 1e-6
+
+
+class UnsupportedModel(ValueError):
+    """The model uses something the flattened evaluator does not implement."""
+
+
+class FlatForest:
+    """
+    A binary-classification forest as flat node arrays over all trees, numbered so that
+    the two children of a split are adjacent:
+    feature (intp), threshold, child (intp, the left child; the right one is child + 1),
+    missing_left (where NaN goes), value (float64, leaf output) and roots (first node of
+    each tree). A leaf splits on an extra all-zero input column with threshold 1 and is its
+    own left child, so rows that reached it stay there.
+
+    kind "mean": positive probability = mean leaf value (RandomForest class-1 fraction).
+    kind "logistic": sigmoid(base_margin + sum of leaf values) (XGBoost binary:logistic).
+    strict: split goes left when x < threshold (XGBoost) instead of x <= threshold.
+
+    Has predict_proba(X) like the models it replaces. Only holds numpy arrays, so the
+    model bundle memory-maps them.
+    """
+
+    # rows walked through the trees together; keeps the per-level temporaries in cache
+    BLOCK_ROWS = 512
+
+    def __init__(self, kind, feature_names, n_features, feature, threshold, child, missing_left, value, roots,
+                 strict, base_margin=0.0):
+        if kind not in ("mean", "logistic"):
+            raise ValueError(f"unknown forest kind: {kind}")
+        self.kind = kind
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.n_features = int(n_features)
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold)
+        self.child = np.ascontiguousarray(child, dtype=np.intp)
+        self.missing_left = np.ascontiguousarray(missing_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.strict = bool(strict)
+        self.base_margin = float(base_margin)
+        self.depth = self._max_depth()
+
+    def __repr__(self):
+        return (f"FlatForest(kind={self.kind!r}, trees={self.n_trees}, nodes={self.n_nodes}, "
+                f"depth={self.depth})")
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.child, self.missing_left,
+                                      self.value, self.roots))
+
+    def _max_depth(self) -> int:
+        """Levels from the deepest root to its leaves: the number of traversal steps needed."""
+        nodes = self.roots
+        depth = 0
+        while True:
+            nodes = nodes[self.child[nodes] != nodes]
+            if not len(nodes):
+                return depth
+            nodes = np.concatenate([self.child[nodes], self.child[nodes] + 1])
+            depth += 1
+
+    def _matrix(self, X) -> np.ndarray:
+        """float32 rows in training feature order, plus the all-zero column the leaves split on."""
+        if hasattr(X, "columns"):
+            if self.feature_names is not None and list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy(dtype=np.float32)
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got shape {X.shape}")
+        out = np.zeros((len(X), self.n_features + 1), dtype=np.float32)
+        out[:, :-1] = X
+        return out
+
+    def _walk(self, X: np.ndarray) -> np.ndarray:
+        n = len(X)
+        flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        check_missing = bool(np.isnan(flat).any())
+        for _ in range(self.depth):
+            x = flat[row_base + self.feature[nodes]]
+            threshold = self.threshold[nodes]
+            # NaN compares False both ways: right unless missing_left says otherwise
+            go_right = ~(x < threshold) if self.strict else ~(x <= threshold)
+            if check_missing:
+                missing = np.isnan(x)
+                go_right[missing] = ~self.missing_left[nodes[missing]]
+            nodes = self.child[nodes] + go_right
+        return nodes
+
+    def leaves(self, X) -> np.ndarray:
+        """Leaf node id reached by every row (axis 0) in every tree (axis 1)."""
+        X = self._matrix(X)
+        if len(X) <= self.BLOCK_ROWS:
+            return self._walk(X)
+        return np.concatenate([self._walk(X[i:i + self.BLOCK_ROWS]) for i in range(0, len(X), self.BLOCK_ROWS)])
+
+    def positive_proba(self, X) -> np.ndarray:
+        total = self.value[self.leaves(X)].sum(axis=1)
+        if self.kind == "mean":
+            return total / self.n_trees
+        return 1.0 / (1.0 + np.exp(-(total + self.base_margin)))
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.positive_proba(X)
+        return np.column_stack([1.0 - p, p])
+
+
+class TreeEngineModel:
+    """
+    A base model scored by its FlatForest, except for batches of more than max_rows rows
+    (0: no limit), which go to the library model: its compiled traversal wins on large batches.
+    """
+
+    def __init__(self, native, forest: FlatForest, max_rows: int = 0):
+        self.native = native
+        self.forest = forest
+        self.max_rows = max_rows
+
+    def predict_proba(self, X):
+        if self.max_rows and len(X) > self.max_rows:
+            return self.native.predict_proba(X)
+        return self.forest.predict_proba(X)
+
+
+def _concatenate(trees: list, n_features: int) -> dict:
+    """
+    Merge per-tree arrays (local child ids, -1 for leaves) into global node arrays,
+    renumbering every tree breadth-first so that sibling nodes are adjacent.
+    """
+    merged = {key: [] for key in ("feature", "threshold", "child", "missing_left", "value")}
+    roots = []
+    offset = 0
+    for tree in trees:
+        left, right = tree["left"], tree["right"]
+        order = [0]
+        child = {}
+        for node in order:
+            if left[node] >= 0:
+                child[node] = len(order)
+                order.extend((left[node], right[node]))
+        order = np.asarray(order, dtype=np.intp)
+        leaf = left[order] < 0
+        ids = np.arange(len(order)) + offset
+        first_child = np.array([child.get(node, -1) for node in order], dtype=np.intp) + offset
+        merged["child"].append(np.where(leaf, ids, first_child))
+        merged["feature"].append(np.where(leaf, n_features, tree["feature"][order]))
+        merged["threshold"].append(np.where(leaf, 1, tree["threshold"][order]).astype(tree["threshold"].dtype))
+        merged["missing_left"].append(np.where(leaf, True, tree["missing_left"][order]))
+        merged["value"].append(tree["value"][order])
+        roots.append(offset)
+        offset += len(order)
+    out = {key: np.concatenate(arrays) for key, arrays in merged.items()}
+    out["roots"] = np.asarray(roots, dtype=np.intp)
+    out["n_features"] = n_features
+    return out
+
+
+def flatten_random_forest(model) -> FlatForest:
+    """FlatForest of a fitted binary RandomForestClassifier (leaf value = class-1 fraction)."""
+    classes = list(getattr(model, "classes_", []))
+    if len(classes) != 2 or getattr(model, "n_outputs_", 1) != 1:
+        raise UnsupportedModel("only single-output binary random forests are supported")
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1)
+        missing = getattr(tree, "missing_go_to_left", None)
+        trees.append({
+            "feature": tree.feature,
+            "threshold": tree.threshold.astype(np.float64),
+            "left": tree.children_left,
+            "right": tree.children_right,
+            "missing_left": np.zeros(tree.node_count, bool) if missing is None else missing.astype(bool),
+            "value": np.divide(counts[:, 1], totals, out=np.zeros_like(totals), where=totals > 0),
+        })
+    names = getattr(model, "feature_names_in_", None)
+    return FlatForest("mean", names, strict=False, **_concatenate(trees, model.n_features_in_))
+
+
+def flatten_xgboost(model) -> FlatForest:
+    """FlatForest of a fitted XGBClassifier / Booster (binary:logistic, gbtree, numeric splits)."""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    missing = getattr(model, "missing", np.nan)
+    if missing is not None and not np.isnan(missing):
+        raise UnsupportedModel(f"missing={missing} is not supported (only NaN)")
+    learner = json.loads(bytes(booster.save_raw("json")))["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise UnsupportedModel(f"objective {objective} is not supported (only binary:logistic)")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise UnsupportedModel(f"booster {gbm['name']} is not supported (only gbtree)")
+    params = learner["learner_model_param"]
+    if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+        raise UnsupportedModel("only single-target binary models are supported")
+    base_score = float(params["base_score"].strip("[]"))
+    base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+    tree_dicts = gbm["model"]["trees"]
+    # predict_proba stops at best_iteration when the model was trained with early stopping
+    try:
+        best_iteration = model.best_iteration
+    except AttributeError:
+        best_iteration = None
+    if best_iteration is not None:
+        tree_dicts = tree_dicts[:gbm["model"]["iteration_indptr"][best_iteration + 1]]
+
+    trees = []
+    for t in tree_dicts:
+        if any(t["split_type"]):
+            raise UnsupportedModel("categorical splits are not supported")
+        left = np.asarray(t["left_children"], dtype=np.int32)
+        conditions = np.asarray(t["split_conditions"], dtype=np.float32)
+        trees.append({
+            "feature": np.asarray(t["split_indices"], dtype=np.int32),
+            "threshold": conditions,
+            "left": left,
+            "right": np.asarray(t["right_children"], dtype=np.int32),
+            "missing_left": np.asarray(t["default_left"], dtype=bool),
+            # a leaf stores its output in split_conditions
+            "value": np.where(left < 0, conditions, 0.0).astype(np.float64),
+        })
+    return FlatForest("logistic", learner.get("feature_names") or None, strict=True,
+                      base_margin=base_margin, **_concatenate(trees, int(params["num_feature"])))
+
+
+def compile_forest(model) -> FlatForest:
+    """FlatForest of a RandomForestClassifier or XGBoost model; UnsupportedModel for anything else."""
+    if hasattr(model, "get_booster") or type(model).__name__ == "Booster":
+        return flatten_xgboost(model)
+    if hasattr(model, "estimators_") and hasattr(model, "classes_"):
+        return flatten_random_forest(model)
+    raise UnsupportedModel(f"{type(model).__name__} cannot be flattened")
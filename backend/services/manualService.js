@@ -137,6 +137,9 @@ function callPythonModel(features, includeDebug = false) {
 		let stdout = '';
 		let stderr = '';
 		const MAX_STDERR = 64 * 1024; // cap stderr buffer to 64KB to avoid memory bloat
+		// Python only writes warnings/errors unless debug is requested; a debug dump goes back in the
+		// response instead of the log (LOG_PY_STDERR=true logs it as well, =false never logs stderr)
+		const logStderr = process.env.LOG_PY_STDERR === 'true' || (!includeDebug && process.env.LOG_PY_STDERR !== 'false');
 
 		py.stdout.on('data', (chunk) => (stdout += chunk.toString()));
 		py.stderr.on('data', (chunk) => {
@@ -144,8 +147,7 @@ function callPythonModel(features, includeDebug = false) {
 			if (stderr.length < MAX_STDERR) {
 				stderr += data.slice(0, Math.max(0, MAX_STDERR - stderr.length));
 			}
-			// Always log stderr to see Python debug output (binning, encoding, etc.)
-			console.error('[Python stderr]', data);
+			if (logStderr) console.error('[Python stderr]', data);
 		});
 
 		py.on('close', (code) => {
@@ -171,11 +173,112 @@ function callPythonModel(features, includeDebug = false) {
 			}
 		});
 
-		py.stdin.write(JSON.stringify(features));
+		py.stdin.write(JSON.stringify(includeDebug ? { ...features, _debug: true } : features));
 		py.stdin.end();
 	});
 }
 
+// Persistent Python worker (`predict.py --serve`), enabled with PYTHON_SERVE=true.
+// Models are loaded once; requests and responses are newline-delimited JSON matched by `_id`.
+// A request without a response after PYTHON_SERVE_TIMEOUT_MS (model loading included) is
+// rejected and the worker is killed; the next request starts a new one.
+const PYTHON_SERVE_TIMEOUT_MS = parseInt(process.env.PYTHON_SERVE_TIMEOUT_MS || '30000', 10);
+let pyWorker = null;
+
+function getPythonWorker() {
+	if (pyWorker) return pyWorker;
+	const pythonScript = path.join(__dirname, '..', 'ml', 'predict.py');
+	const pythonCmd = process.env.PYTHON_EXECUTABLE || (process.platform === 'win32' ? 'python' : 'python3');
+
+	const proc = spawn(pythonCmd, [pythonScript, '--serve'], {
+		stdio: ['pipe', 'pipe', 'pipe'],
+		cwd: path.join(__dirname, '..'),
+	});
+	const worker = { proc, pending: new Map(), nextId: 1, buffer: '' };
+	let resolveReady;
+	let rejectReady;
+	worker.ready = new Promise((resolve, reject) => {
+		resolveReady = resolve;
+		rejectReady = reject;
+	});
+	worker.ready.catch(() => {});
+
+	const fail = (err) => {
+		if (pyWorker === worker) pyWorker = null;
+		rejectReady(err);
+		for (const p of worker.pending.values()) p.reject(err);
+		worker.pending.clear();
+	};
+	worker.fail = fail;
+
+	proc.stdout.on('data', (chunk) => {
+		worker.buffer += chunk.toString();
+		let idx;
+		while ((idx = worker.buffer.indexOf('\n')) >= 0) {
+			const line = worker.buffer.slice(0, idx).trim();
+			worker.buffer = worker.buffer.slice(idx + 1);
+			if (!line) continue;
+			let msg;
+			try {
+				msg = JSON.parse(line);
+			} catch (e) {
+				console.error('[Python worker] Ignoring non-JSON output:', line);
+				continue;
+			}
+			if (msg.status === 'ready') {
+				resolveReady();
+				continue;
+			}
+			if (msg._id === undefined) {
+				// Startup failure (e.g. models missing) or unmatched error
+				if (msg.error) fail(new Error(`Python model error: ${msg.error}`));
+				continue;
+			}
+			const p = worker.pending.get(msg._id);
+			if (!p) continue;
+			worker.pending.delete(msg._id);
+			delete msg._id;
+			if (msg.error) p.reject(new Error(`Python model error: ${msg.error}`));
+			else p.resolve(msg);
+		}
+	});
+	proc.stderr.on('data', (chunk) => {
+		if (process.env.LOG_PY_STDERR !== 'false') console.error('[Python worker stderr]', chunk.toString());
+	});
+	proc.on('error', (err) => fail(new Error(`Failed to spawn Python worker (${pythonCmd}): ${err.message}`)));
+	proc.on('exit', (code) => fail(new Error(`Python worker exited with code ${code}`)));
+
+	pyWorker = worker;
+	return worker;
+}
+
+async function callPythonWorker(features, includeDebug = false) {
+	const worker = getPythonWorker();
+	let timer;
+	const timeout = new Promise((_, reject) => {
+		if (!(PYTHON_SERVE_TIMEOUT_MS > 0)) return;
+		timer = setTimeout(() => {
+			const err = new Error(`Python worker did not answer within ${PYTHON_SERVE_TIMEOUT_MS} ms; restarting it`);
+			reject(err);
+			// a stuck worker would hold every later request too: fail them all and replace it
+			worker.fail(err);
+			worker.proc.kill('SIGKILL');
+		}, PYTHON_SERVE_TIMEOUT_MS);
+	});
+	const request = worker.ready.then(() => {
+		const id = worker.nextId++;
+		return new Promise((resolve, reject) => {
+			worker.pending.set(id, { resolve, reject });
+			worker.proc.stdin.write(JSON.stringify({ ...features, _id: id, _debug: includeDebug }) + '\n');
+		});
+	});
+	try {
+		return await Promise.race([request, timeout]);
+	} finally {
+		clearTimeout(timer);
+	}
+}
+
 async function analyzeManualTransaction(input) {
 	console.log('[ManualService] Received input:', JSON.stringify(input, null, 2));
 	try {
@@ -184,14 +287,22 @@ async function analyzeManualTransaction(input) {
 		
 		row = computeEngineeredFeatures(row);
 		console.log('[ManualService] After engineering:', JSON.stringify(row, null, 2));
+
+		// lets the Python side store a retried request as the same transaction row
+		const idempotencyKey = input.idempotencyKey || input.idempotency_key;
+		if (idempotencyKey) row.idempotency_key = String(idempotencyKey);
 		
 		const includeDebug = !!input.debug || process.env.MANUAL_DEBUG === 'true';
 		console.log(`[ManualService] Calling Python model... includeDebug=${includeDebug} (query/header/env)`);
-		const mlResult = await callPythonModel(row, includeDebug);
+		const mlResult = process.env.PYTHON_SERVE === 'true'
+			? await callPythonWorker(row, includeDebug)
+			: await callPythonModel(row, includeDebug);
 		console.log('[ManualService] Python result:', JSON.stringify(mlResult, null, 2));
 
 		// Persist into DB disabled unless SAVE_TO_DB=true
-		if (process.env.SAVE_TO_DB === 'true') {
+		if (process.env.SAVE_TO_DB === 'true' && mlResult.persisted === true) {
+			console.log('[ManualService] Transaction already saved by the Python model');
+		} else if (process.env.SAVE_TO_DB === 'true') {
 			try {
 				await insertPredictionIntoDb(row, mlResult);
 				console.log('[ManualService] Saved to database');